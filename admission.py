@@ -0,0 +1,100 @@
+"""Memory-aware admission of batch tasks into a worker pool.
+
+Each task's peak memory is estimated from its header before it is submitted. A task enters the
+pool only while the estimates of all submitted, unfinished tasks fit in the memory budget, so a
+batch mixing thumbnails with 100 MP scans runs many small files in parallel but only as many large
+ones as fit, instead of letting every worker decode one at once.
+"""
+import os
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Share of the memory available at the start of a batch that its tasks may use together
+MEMORY_FRACTION = 0.6
+_END = object()
+
+
+def _windows_available_memory():
+    import ctypes
+
+    class MEMORYSTATUSEX(ctypes.Structure):
+        _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+    status = MEMORYSTATUSEX()
+    status.dwLength = ctypes.sizeof(status)
+    if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+        return None
+    return status.ullAvailPhys
+
+
+def available_memory():
+    """Bytes of physical memory available now (total memory where that is all the OS tells), or None."""
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    if sys.platform == "win32":
+        try:
+            return _windows_available_memory()
+        except (AttributeError, OSError):
+            return None
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def memory_budget(settings):
+    """Bytes a batch may hold in running tasks: settings['memory_mb'] if set, else MEMORY_FRACTION
+    of available memory. None (no limit) when neither is known."""
+    if settings.get('memory_mb'):
+        return int(settings['memory_mb'] * 1024 * 1024)
+    available = available_memory()
+    return int(available * MEMORY_FRACTION) if available else None
+
+
+def admit_in_order(pool, fn, weighted, args, budget, ahead):
+    """Yields fn(item, *args) for every (item, cost) of weighted, run on pool, in item order.
+
+    At most ahead items are submitted or waiting to be yielded. With a budget, the next item is
+    only submitted while its cost plus the cost of the unfinished submitted items fits; an item
+    that is over budget on its own runs alone. Unstarted items are cancelled when the generator
+    is closed.
+    """
+    window = deque()
+    weighted = iter(weighted)
+    item, item_cost = next(weighted, (_END, 0))
+    try:
+        while item is not _END or window:
+            while item is not _END and len(window) < ahead:
+                in_flight = sum(c for future, c in window if not future.done())
+                if budget is not None and in_flight and in_flight + item_cost > budget:
+                    break
+                window.append((pool.submit(fn, item, *args), item_cost))
+                item, item_cost = next(weighted, (_END, 0))
+
+            head = window[0][0]
+            if not head.done():
+                # Any finish frees budget, not just the head's
+                wait([future for future, _ in window if not future.done()], return_when=FIRST_COMPLETED)
+                continue
+            window.popleft()
+            yield head.result()
+    finally:
+        for future, _ in window:
+            future.cancel()
@@ -0,0 +1,98 @@
+"""Animated GIF and WebP: resize every frame, keeping durations, loop count and disposal.
+
+Frames are decoded in order (GIF frames depend on the previous one) and resized on a thread pool;
+Pillow releases the GIL while resampling. GIF output is mapped onto one shared palette built from
+a sample of the resized frames instead of letting the GIF writer quantize every frame adaptively, which is both
+much faster and lets the writer store frames as small deltas against a global color table.
+"""
+from PIL import Image, ImageSequence
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+ANIMATED_FORMATS = ["GIF", "WEBP"]
+# Decoded frames queued ahead of the resize threads, per thread
+FRAMES_AHEAD = 2
+# Shared GIF palette: 255 colors, the last index is kept for transparency
+PALETTE_COLORS = 255
+# Frames sampled (evenly spaced) to build the shared palette, each shrunk to at most this side
+PALETTE_SAMPLE_FRAMES = 16
+PALETTE_SAMPLE_SIDE = 128
+TRANSPARENT_INDEX = 255
+DEFAULT_DURATION = 100
+
+
+def is_animated(img):
+    return getattr(img, 'n_frames', 1) > 1
+
+
+def build_palette(frames):
+    """Shared palette image for a GIF, from up to PALETTE_SAMPLE_FRAMES evenly spaced frames."""
+    step = max(1, len(frames) // PALETTE_SAMPLE_FRAMES)
+    samples = []
+    for frame in frames[::step][:PALETTE_SAMPLE_FRAMES]:
+        frame = frame.convert("RGB")
+        frame.thumbnail((PALETTE_SAMPLE_SIDE, PALETTE_SAMPLE_SIDE), Image.Resampling.BOX)
+        samples.append(frame)
+    sheet = Image.new("RGB", (max(f.width for f in samples), sum(f.height for f in samples)))
+    y = 0
+    for frame in samples:
+        sheet.paste(frame, (0, y))
+        y += frame.height
+    return sheet.quantize(PALETTE_COLORS)
+
+
+def to_palette(frame, palette):
+    """Maps an RGBA frame onto the shared palette; mostly transparent pixels get TRANSPARENT_INDEX."""
+    # No dithering: it differs from frame to frame, which flickers and defeats the GIF delta frames
+    out = frame.convert("RGB").quantize(palette=palette, dither=Image.Dither.NONE)
+    alpha = frame.getchannel("A")
+    if alpha.getextrema()[0] < 128:
+        out.paste(TRANSPARENT_INDEX, mask=alpha.point(lambda a: 255 if a < 128 else 0))
+        out.info['transparency'] = TRANSPARENT_INDEX
+    return out
+
+
+def resize_frames(img, resize, gif, threads=None):
+    """Resizes every frame of img with resize(frame) -> frame. Returns (frames, durations, disposal).
+
+    Frames are RGBA (P on the shared palette when gif is set), in order. At most
+    FRAMES_AHEAD x threads decoded frames are waiting at any time.
+    """
+    threads = max(1, threads or os.cpu_count() or 1)
+    durations, disposal = [], []
+
+    def decoded():
+        for frame in ImageSequence.Iterator(img):
+            # Converting loads the frame; WebP only fills in the duration on load
+            rgba = frame.convert("RGBA")
+            durations.append(frame.info.get('duration', DEFAULT_DURATION))
+            disposal.append(getattr(img, 'disposal_method', 0))
+            yield rgba
+
+    out = []
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        window = deque()
+        for frame in decoded():
+            window.append(pool.submit(resize, frame))
+            if len(window) >= threads * FRAMES_AHEAD:
+                out.append(window.popleft().result())
+        out.extend(future.result() for future in window)
+
+        if gif:
+            palette = build_palette(out)
+            out = list(pool.map(lambda frame: to_palette(frame, palette), out))
+    return out, durations, disposal
+
+
+def animation_save_args(img, fmt, durations, disposal):
+    """save_all keyword arguments carrying the source timing over to fmt."""
+    args = {'save_all': True, 'duration': durations}
+    if fmt == "GIF":
+        # A GIF without a loop count plays once; keep it that way
+        if 'loop' in img.info:
+            args['loop'] = img.info['loop']
+        args['disposal'] = disposal
+    else:
+        args['loop'] = img.info.get('loop', 0)
+    return args
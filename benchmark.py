@@ -0,0 +1,250 @@
+"""Reproducible benchmark over a synthetic image corpus. Runs without Tk, e.g.:
+
+    python benchmark.py -o before.json
+    python benchmark.py --quick --compare before.json -o after.json
+
+The corpus (icons to 50 MP; JPEG, PNG, GIF, WebP, BMP and ICO; RGB, RGBA and palette modes) is
+generated from a fixed seed, so every run and every version sees the same pixels. Each scenario runs
+in its own process, so its peak RSS is not inflated by the scenarios before it.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from PIL import Image, ImageChops
+import PIL
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is reported as null
+    resource = None
+
+CORPUS_VERSION = 1
+SEED = 1234
+# (name, (w, h), format, mode)
+CORPUS = [
+    ("icon_32", (32, 32), "ICO", "RGBA"),
+    ("icon_256", (256, 256), "ICO", "RGBA"),
+    ("logo_rgba", (512, 512), "PNG", "RGBA"),
+    ("sprite_p", (640, 480), "PNG", "P"),
+    ("banner_p", (800, 200), "GIF", "P"),
+    ("photo_vga", (640, 480), "JPEG", "RGB"),
+    ("photo_hd", (1920, 1080), "JPEG", "RGB"),
+    ("photo_hd", (1920, 1080), "WEBP", "RGB"),
+    ("overlay_hd", (1920, 1080), "WEBP", "RGBA"),
+    ("screenshot_qhd", (2560, 1440), "PNG", "RGB"),
+    ("scan_a4", (2480, 3508), "BMP", "RGB"),
+    ("photo_12mp", (4000, 3000), "JPEG", "RGB"),
+    ("photo_50mp", (8660, 5774), "JPEG", "RGB"),
+    ("raw_50mp", (8660, 5774), "BMP", "RGB"),
+]
+# Entries at least this large are left out by --quick
+LARGE_PIXELS = 20_000_000
+SCENARIOS = ["batch", "thumbnails", "preview", "estimator"]
+SCREEN_SIZE = (1920, 1080)
+
+
+# ========================================== CORPUS ======================================
+
+def synth_image(size, mode, seed):
+    """Deterministic photo-like content: two octaves of smooth seeded noise, plus a gradient alpha for RGBA."""
+    rng = random.Random(seed)
+    coarse = Image.frombytes("RGB", (16, 16), rng.randbytes(16 * 16 * 3)).resize(size, Image.Resampling.BICUBIC)
+    fine = Image.frombytes("RGB", (128, 128), rng.randbytes(128 * 128 * 3)).resize(size, Image.Resampling.BICUBIC)
+    img = ImageChops.add(coarse, fine, scale=2.0)
+    if mode == "RGBA":
+        img.putalpha(Image.linear_gradient("L").resize(size))
+    elif mode == "P":
+        img = img.quantize(256)
+    return img
+
+
+def corpus_files(corpus_dir, quick, copies):
+    """Generates the corpus into corpus_dir once (reused while CORPUS_VERSION matches); returns its files."""
+    manifest = os.path.join(corpus_dir, "manifest.json")
+    meta = {'version': CORPUS_VERSION, 'seed': SEED, 'quick': quick, 'copies': copies}
+    if os.path.exists(manifest):
+        with open(manifest, encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved['meta'] == meta:
+            return saved['files']
+        shutil.rmtree(corpus_dir)
+    os.makedirs(corpus_dir, exist_ok=True)
+
+    files = []
+    for i, (name, size, fmt, mode) in enumerate(CORPUS):
+        if quick and size[0] * size[1] >= LARGE_PIXELS:
+            continue
+        ext = ".jpg" if fmt == "JPEG" else f".{fmt.lower()}"
+        first = os.path.join(corpus_dir, f"{name}_{mode.lower()}_0{ext}")
+        print(f"generating {os.path.basename(first)} ({size[0]}x{size[1]})", file=sys.stderr)
+        synth_image(size, mode, SEED + i).save(first, fmt)
+        files.append(first)
+        for copy in range(1, copies):
+            path = os.path.join(corpus_dir, f"{name}_{mode.lower()}_{copy}{ext}")
+            shutil.copyfile(first, path)
+            files.append(path)
+
+    with open(manifest, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'files': files}, f)
+    return files
+
+
+# ========================================== SCENARIOS ======================================
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(name, files, workers):
+    """Runs one scenario in this process; returns its metrics."""
+    from engine import default_settings, resize, run_batch
+    from preview_cache import ImageCache, load_thumbnail
+
+    start = time.perf_counter()
+    if name == "batch":
+        settings = default_settings()
+        settings.update(unit='px', width='1920', format='JPEG', quality=80, workers=workers)
+        out_dir = tempfile.mkdtemp(prefix="sandy-bench-")
+        try:
+            _, errors = run_batch(files, settings, out_dir, workers, resume=False)
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+    elif name == "thumbnails":
+        errors = [(f, "unreadable") for f in files if load_thumbnail(f) is None]
+    elif name == "preview":
+        cache = ImageCache(256 * 1024 * 1024, SCREEN_SIZE)
+        for f in files:
+            cache.get(f, 0)
+        errors = []
+    elif name == "estimator":
+        # What "Calculate Size" does for the current file, with the app's default settings
+        errors = [(r['path'], r['error']) for r in (resize(f, default_settings()) for f in files)
+                  if r['error'] is not None]
+    else:
+        raise ValueError(f"unknown scenario {name!r}")
+    seconds = time.perf_counter() - start
+
+    total_bytes = sum(os.path.getsize(f) for f in files)
+    return {
+        'scenario': name,
+        'images': len(files),
+        'input_mb': round(total_bytes / (1024 * 1024), 2),
+        'seconds': round(seconds, 3),
+        'images_per_sec': round(len(files) / seconds, 2),
+        'mb_per_sec': round(total_bytes / (1024 * 1024) / seconds, 2),
+        'peak_rss_mb': peak_rss_mb(),
+        'errors': len(errors),
+    }
+
+
+def run_isolated(step, corpus_dir, quick, copies, workers):
+    """Runs a step (--generate or --run-scenario NAME) in a fresh interpreter; returns its stdout.
+
+    Linux carries the peak RSS of a process across exec, so this process must stay small itself:
+    even the corpus is generated in a child.
+    """
+    cmd = [sys.executable, os.path.abspath(__file__)] + step + [
+        "--corpus", corpus_dir, "--copies", str(copies), "--workers", str(workers)] + (["--quick"] if quick else [])
+    return subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, baseline=None):
+    before = {r['scenario']: r for r in (baseline or {}).get('scenarios', [])}
+    print(f"{'scenario':<12}{'images/s':>10}{'MB/s':>9}{'peak MB':>9}{'seconds':>9}", file=sys.stderr)
+    for r in results:
+        line = (f"{r['scenario']:<12}{r['images_per_sec']:>10}{r['mb_per_sec']:>9}{str(r['peak_rss_mb']):>9}"
+                f"{r['seconds']:>9}")
+        old = before.get(r['scenario'])
+        if old and old['images_per_sec']:
+            line += f"   x{r['images_per_sec'] / old['images_per_sec']:.2f} speed vs baseline"
+            if old['peak_rss_mb'] and r['peak_rss_mb']:
+                line += f", x{r['peak_rss_mb'] / old['peak_rss_mb']:.2f} memory"
+        print(line, file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Sandy Resizer Pro - benchmark")
+    parser.add_argument("-o", "--output", help="write results as JSON here (default: stdout)")
+    parser.add_argument("--corpus",
+                        default=os.path.join(tempfile.gettempdir(), f"sandy-bench-corpus-v{CORPUS_VERSION}"),
+                        help="corpus folder, generated on first use")
+    parser.add_argument("--quick", action="store_true",
+                        help=f"leave out images of {LARGE_PIXELS // 1_000_000} MP and up")
+    parser.add_argument("--copies", type=int, default=3, help="copies of each corpus image (default: 3)")
+    parser.add_argument("-s", "--scenario", action="append", choices=SCENARIOS,
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes for the batch scenario (default: CPU count)")
+    parser.add_argument("--compare", help="earlier results JSON to print speed and memory ratios against")
+    parser.add_argument("--run-scenario", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--generate", action="store_true", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    copies, workers = max(1, args.copies), max(1, args.workers)
+    if args.generate:
+        corpus_files(args.corpus, args.quick, copies)
+        return 0
+    if args.run_scenario:
+        files = corpus_files(args.corpus, args.quick, copies)
+        print(json.dumps(run_scenario(args.run_scenario, files, workers)))
+        return 0
+
+    run_isolated(["--generate"], args.corpus, args.quick, copies, workers)
+    files = corpus_files(args.corpus, args.quick, copies)
+    results = []
+    for name in args.scenario or SCENARIOS:
+        output = run_isolated(["--run-scenario", name], args.corpus, args.quick, copies, workers)
+        results.append(json.loads(output.splitlines()[-1]))
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'workers': workers,
+        'corpus': {'version': CORPUS_VERSION, 'seed': SEED, 'quick': args.quick, 'copies': copies,
+                   'images': len(files), 'mb': round(sum(os.path.getsize(f) for f in files) / (1024 * 1024), 1)},
+        'scenarios': results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""Command-line batch resizer. Runs without Tk, e.g.:
+
+    python cli.py photos/ -o out/ --unit px --width 1920 --format WEBP --quality 75
+    python cli.py photos/ -o out/ -t "preset=Instagram Post (1080x1080)" -t "unit=px,width=3840,format=WEBP"
+    python cli.py scans/ -o out/ --format PDF --preset "A4 (210x297 mm)" --dpi 150 --merge
+    python cli.py photos/ -o delivery.zip --unit px --width 1600
+"""
+import argparse
+import os
+import sys
+from engine import (OUTPUT_FORMATS, UNITS, RESAMPLE_PROFILES, DEFAULT_RESAMPLE, RENAME_ORIGINAL, RENAME_SIZE,
+                    RENAME_SUFFIX, default_settings, presets_for_format, apply_preset, output_spec, run_batch)
+from merge import MERGE_FORMATS, is_merge, run_merged
+from metrics import StageMetrics
+from output_writer import free_archive_path, is_archive
+from scan import iter_image_files
+
+RENAME_CHOICES = {"original": RENAME_ORIGINAL, "size": RENAME_SIZE, "suffix": RENAME_SUFFIX}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Sandy Resizer Pro - headless batch resize")
+    parser.add_argument("inputs", nargs="*", help="image files and/or folders")
+    parser.add_argument("-o", "--output",
+                        help="output folder (created if missing), or a .zip/.tar/.tar.gz/.tgz archive to write into")
+    parser.add_argument("-f", "--format", type=str.upper, choices=OUTPUT_FORMATS, default="JPEG")
+    parser.add_argument("-u", "--unit", choices=UNITS, default="percent")
+    parser.add_argument("-W", "--width", default="", help="width in the chosen unit, or scale for percent")
+    parser.add_argument("-H", "--height", default="", help="height in the chosen unit")
+    parser.add_argument("--dpi", type=float, default=96.0, help="DPI for inch/cm/mm (default: 96)")
+    parser.add_argument("-p", "--preset", help="preset name, overrides unit/width/height (see --list-presets)")
+    parser.add_argument("--list-presets", action="store_true", help="list presets for --format and exit")
+    parser.add_argument("--no-keep-ratio", dest="keep_ratio", action="store_false",
+                        help="do not derive the missing side from the original ratio")
+    parser.add_argument("-r", "--rotate", choices=["0", "90", "180", "270"], default="0")
+    parser.add_argument("-q", "--quality", type=int, default=80, help="1-100 (default: 80)")
+    parser.add_argument("--max-kb", type=float, default=0,
+                        help="fit each output under this many KB by lowering quality, then size (default: off)")
+    parser.add_argument("--resample", choices=list(RESAMPLE_PROFILES), default=DEFAULT_RESAMPLE,
+                        help=f"speed/quality profile (default: {DEFAULT_RESAMPLE})")
+    parser.add_argument("--rename", choices=list(RENAME_CHOICES), default="size",
+                        help="original name, name_WxH, or name_suffix (default: size)")
+    parser.add_argument("--suffix", default="", help="suffix for --rename suffix")
+    parser.add_argument("-t", "--target", action="append", default=[], metavar="SPEC",
+                        help="add an output (repeatable): comma-separated key=value over the options above, "
+                             "keys: format, unit, width, height, dpi, preset, keep_ratio, quality, max_kb, "
+                             "resample, rename, suffix. Each source is decoded once for all targets.")
+    parser.add_argument("--merge", action="store_true",
+                        help=f"write all inputs into one file ({', '.join(MERGE_FORMATS)}): pages or animation frames")
+    parser.add_argument("--frame-ms", type=int, default=500, help="frame duration for --merge GIF/WEBP (default: 500)")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="ignore the journal in the output folder and redo every file")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="time each pipeline stage per file; write histograms to FILE (.json or .csv)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--memory-mb", type=float, default=0,
+                        help="memory the running tasks may use together, in MB (default: 60%% of available memory)")
+    return parser
+
+
+def settings_from_args(args):
+    settings = default_settings()
+    settings.update({
+        'width': args.width,
+        'height': args.height,
+        'unit': args.unit,
+        'keep_ratio': args.keep_ratio,
+        'format': args.format,
+        'rotate': args.rotate,
+        'quality': max(1, min(100, args.quality)),
+        'rename_option': RENAME_CHOICES[args.rename],
+        'suffix': args.suffix,
+        'dpi': args.dpi,
+        'max_kb': max(0.0, args.max_kb),
+        'resample': args.resample,
+        'workers': max(1, args.workers),
+        'merge': args.merge,
+        'frame_ms': max(1, args.frame_ms),
+        'memory_mb': max(0.0, args.memory_mb)
+    })
+    if args.unit == "percent" and not args.width:
+        settings['width'] = '100'
+    if args.preset:
+        apply_preset(settings, args.preset)
+    if args.target:
+        settings['outputs'] = [parse_target(spec, settings) for spec in args.target]
+    return settings
+
+
+def parse_target(spec, base):
+    """Turns "format=WEBP,unit=px,width=1080" into an output entry on top of the base settings."""
+    settings = dict(base)
+    preset = None
+    for item in spec.split(","):
+        key, sep, value = item.partition("=")
+        key, value = key.strip().replace("-", "_"), value.strip()
+        if not sep or not key:
+            raise ValueError(f"expected key=value, got {item!r}")
+        if key == "format":
+            if value.upper() not in OUTPUT_FORMATS:
+                raise ValueError(f"unknown format {value!r}")
+            settings['format'] = value.upper()
+        elif key == "unit":
+            if value not in UNITS:
+                raise ValueError(f"unknown unit {value!r}")
+            settings['unit'] = value
+        elif key in ("width", "height", "suffix"):
+            settings[key] = value
+        elif key in ("dpi", "max_kb"):
+            settings[key] = float(value)
+        elif key == "quality":
+            settings['quality'] = max(1, min(100, int(value)))
+        elif key == "keep_ratio":
+            settings['keep_ratio'] = value.lower() in ("1", "true", "yes", "on")
+        elif key == "rename":
+            if value not in RENAME_CHOICES:
+                raise ValueError(f"unknown rename mode {value!r}")
+            settings['rename_option'] = RENAME_CHOICES[value]
+        elif key == "resample":
+            if value not in RESAMPLE_PROFILES:
+                raise ValueError(f"unknown resample profile {value!r}")
+            settings['resample'] = value
+        elif key == "preset":
+            preset = value
+        else:
+            raise ValueError(f"unknown key {key!r}")
+    if preset:
+        if preset not in presets_for_format(settings['format']):
+            raise ValueError(f"unknown preset for {settings['format']}: {preset!r}")
+        apply_preset(settings, preset)
+    return output_spec(settings)
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.list_presets:
+        for name, (w, h) in presets_for_format(args.format).items():
+            if name != "Custom":
+                print(f"{name}: {w} x {h}")
+        return 0
+
+    if not args.inputs or not args.output:
+        parser.error("inputs and -o/--output are required")
+    if args.preset and args.preset not in presets_for_format(args.format):
+        parser.error(f"unknown preset for {args.format}: {args.preset!r} (see --list-presets)")
+    if args.merge and (args.format not in MERGE_FORMATS or args.target):
+        parser.error(f"--merge needs --format {'/'.join(MERGE_FORMATS)} and no --target")
+    if args.merge and is_archive(args.output):
+        parser.error("--merge writes a single file; give -o a folder")
+
+    try:
+        settings = settings_from_args(args)
+    except ValueError as e:
+        parser.error(f"--target: {e}")
+
+    # The same walk as the GUI's Add Folder: recursive, each file once
+    files = list(iter_image_files(args.inputs))
+    if not files:
+        print("No supported images found.", file=sys.stderr)
+        return 1
+
+    output = args.output
+    if is_archive(output):
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        # Like output files, an existing archive is kept and the new one gets a _N name
+        output = free_archive_path(output)
+        if output != args.output:
+            print(f"{args.output} exists, writing {output}", file=sys.stderr)
+    else:
+        os.makedirs(output, exist_ok=True)
+    if is_merge(settings):
+        success_count, errors = run_merged(files, settings, output, settings['workers'])
+    else:
+        metrics = StageMetrics() if args.metrics else None
+        success_count, errors = run_batch(files, settings, output, settings['workers'], args.resume,
+                                          metrics=metrics)
+        if metrics is not None:
+            metrics.export(args.metrics)
+            print(metrics.format_summary(), file=sys.stderr)
+
+    for path, error in errors:
+        print(f"Error processing {path}: {error}", file=sys.stderr)
+    print(f"Completed! Success: {success_count} Errors/Skipped: {len(errors)}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
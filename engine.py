@@ -0,0 +1,946 @@
+"""Headless resize engine shared by the Tk app and the command line.
+
+Nothing here may import tkinter: it has to run on servers, in cron and in containers.
+"""
+from PIL import Image
+import os
+import io
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from tiling import (RAW_STRIP_FORMATS, STRIP_SOURCE_ROWS, DecodedRows, open_row_source, resize_in_strips,
+                    should_stream)
+from pdf_input import is_pdf, page_count, page_size, render_page
+from animation import ANIMATED_FORMATS, animation_save_args, is_animated, resize_frames
+from journal import BatchJournal, NoJournal
+from metrics import recording, stage
+from planner import (exif_orientation, mode_bytes, orientation_transpose, plan_operations, run_plan,
+                     transposed_size)
+from admission import admit_in_order, memory_budget
+from pipeline import PipelineClock, StageThread, prefetch, read_through
+from output_writer import SYNC_SECONDS, ArchiveWriter, OutputWriter, is_archive
+
+# Constants
+SUPPORTED_FORMATS = ['.bmp', '.jpg', '.jpeg', '.gif', '.png', '.pdf', '.webp', '.ico']
+OUTPUT_FORMATS = ["JPEG", "PNG", "WEBP", "GIF", "BMP", "ICO", "PDF"]
+UNITS = ["px", "percent", "inch", "cm", "mm"]
+MAX_DIM = 20000
+
+RENAME_ORIGINAL = "Original Name"
+RENAME_SIZE = "[Original Name]_[Width]×[Height]"
+RENAME_SUFFIX = "Add Suffix"
+RENAME_OPTIONS = [RENAME_ORIGINAL, RENAME_SIZE, RENAME_SUFFIX]
+
+# !--- PRESETS ---
+PRESETS_GENERAL = {
+    "Custom": (0, 0), "1:1 (Square - 1080x1080)": (1080, 1080),
+    "4:3 (Standard - 1440x1080)": (1440, 1080), "3:2 (Photo - 1440x960)": (1440, 960),
+    "16:9 (Widescreen - 1920x1080)": (1920, 1080), "21:9 (Ultra-Wide - 2560x1080)": (2560, 1080),
+    "Passport Photo (35x45 mm)": (35, 45), "HD Wallpaper (1920x1080)": (1920, 1080),
+    "4K Wallpaper (3840x2160)": (3840, 2160), "Instagram Post (1080x1080)": (1080, 1080),
+}
+PRESETS_PDF = {
+    "Custom": (0, 0), "A4 (210x297 mm)": (210, 297), "A3 (297x420 mm)": (297, 420),
+    "A5 (148x210 mm)": (148, 210), "Letter (216x279 mm)": (216, 279),
+}
+PRESETS_ICO = {
+    "Custom": (0, 0), "16x16 px": (16, 16), "32x32 px": (32, 32),
+    "64x64 px": (64, 64), "256x256 px": (256, 256),
+}
+
+
+# !--- RESAMPLING PROFILES ---
+# filter: the final resampling filter. reducing_gap: shrink by integer reduce() passes first, until the
+# image is within this factor of the target (None = filter the full-resolution image directly).
+RESAMPLE_PROFILES = {
+    "fast": {'filter': Image.Resampling.BILINEAR, 'reducing_gap': 1.5},
+    "balanced": {'filter': Image.Resampling.LANCZOS, 'reducing_gap': 3.0},
+    "best": {'filter': Image.Resampling.LANCZOS, 'reducing_gap': None},
+}
+DEFAULT_RESAMPLE = "best"
+
+
+# ========================================== SETTINGS ======================================
+
+def default_settings():
+    """Same defaults the Tk app starts with."""
+    return {
+        'width': '100',
+        'height': '',
+        'unit': 'percent',
+        'keep_ratio': True,
+        'format': 'JPEG',
+        'rotate': '0',
+        'quality': 80,
+        'rename_option': RENAME_SIZE,
+        'suffix': '',
+        'dpi': 96.0,
+        'max_kb': 0,
+        'resample': DEFAULT_RESAMPLE,
+        'workers': os.cpu_count() or 1,
+        'merge': False,
+        'frame_ms': 500,
+        'memory_mb': 0
+    }
+
+
+def presets_for_format(fmt):
+    if fmt == "PDF":
+        return PRESETS_PDF
+    elif fmt == "ICO":
+        return PRESETS_ICO
+    return PRESETS_GENERAL
+
+
+def apply_preset(settings, name):
+    """Applies a preset the way the Presets combobox does. Raises KeyError for unknown names."""
+    w, h = presets_for_format(settings['format'])[name]
+    if name == "Custom":
+        return settings
+    settings['unit'] = "mm" if "mm" in name else "px"
+    settings['width'] = str(w)
+    settings['height'] = str(h)
+    settings['keep_ratio'] = False
+    return settings
+
+
+def resample_profile(settings):
+    return RESAMPLE_PROFILES.get(settings.get('resample'), RESAMPLE_PROFILES[DEFAULT_RESAMPLE])
+
+
+def resize_image(img, size, settings, box=None):
+    """img.resize() with the filter and reduce() pre-pass of the selected resampling profile."""
+    profile = resample_profile(settings)
+    with stage("resize"):
+        return img.resize(size, profile['filter'], box=box, reducing_gap=profile['reducing_gap'])
+
+
+def output_dpi(settings):
+    # -----------------------------------Force 96 DPI for PX and Percent, otherwise use settings
+    if settings['unit'] in ['px', 'percent']:
+        return 96.0
+    return settings['dpi']
+
+
+# ========================================== DIMENSIONS & NAMING ======================================
+
+def compute_target_dimensions(size, settings):
+    try:
+        orig_w, orig_h = size
+        unit = settings['unit']
+
+        try:
+            target_w = float(settings['width'])
+        except:
+            target_w = 0
+
+        try:
+            target_h = float(settings['height'])
+        except:
+            target_h = 0
+
+        if unit == "percent":
+            scale = (target_w if target_w > 0 else 100) / 100.0
+            new_w = int(orig_w * scale)
+            new_h = int(orig_h * scale)
+
+        elif unit in ["inch", "cm", "mm"]:
+            val_w, val_h = target_w, target_h
+            dpi = settings['dpi']
+
+            # -----------------------------------Safety check for DPI-----------------------------------
+            if dpi <= 0: dpi = 96.0
+
+            if unit == "cm":
+                val_w /= 2.54;
+                val_h /= 2.54
+            elif unit == "mm":
+                val_w /= 25.4;
+                val_h /= 25.4
+
+            new_w = int(val_w * dpi) if target_w > 0 else 0
+            new_h = int(val_h * dpi) if target_h > 0 else 0
+
+            if settings['keep_ratio']:
+                if target_w > 0 and target_h <= 0:
+                    new_h = int(new_w * (orig_h / orig_w))
+                elif target_h > 0 and target_w <= 0:
+                    new_w = int(new_h * (orig_w / orig_h))
+
+        else:
+            # -----------------------------------Pixels-----------------------------------
+            new_w = int(target_w) if target_w > 0 else orig_w
+            new_h = int(target_h) if target_h > 0 else orig_h
+
+            if settings['keep_ratio']:
+                if target_w > 0 and target_h <= 0:
+                    new_h = int(new_w * (orig_h / orig_w))
+                elif target_h > 0 and target_w <= 0:
+                    new_w = int(new_h * (orig_w / orig_h))
+
+        # !-----------------------------------Safety check for extremely large dimensions
+        if new_w > MAX_DIM: new_w = MAX_DIM
+        if new_h > MAX_DIM: new_h = MAX_DIM
+
+        if new_w <= 0: new_w = orig_w
+        if new_h <= 0: new_h = orig_h
+
+        return max(1, new_w), max(1, new_h)
+    except Exception as e:
+        print(f"Dimension Error: {e}")
+        return size
+
+
+def build_output_name(base_name, w, h, settings):
+    choice = settings['rename_option']
+    if choice == RENAME_SIZE:
+        return f"{base_name}_{w}x{h}"
+    elif choice == RENAME_SUFFIX:
+        return f"{base_name}_{settings['suffix']}"
+    else:
+        return base_name
+
+
+def output_extension(fmt):
+    ext = f".{fmt.lower()}"
+    if ext == ".jpeg": ext = ".jpg"
+    return ext
+
+
+def format_size(size_bytes):
+    if size_bytes < 1024:
+        return f"{size_bytes} Bytes"
+    elif size_bytes < 1024 * 1024:
+        return f"{size_bytes / 1024:.2f} KB"
+    return f"{size_bytes / (1024 * 1024):.2f} MB"
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    elif seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds // 3600}h {seconds // 60 % 60:02d}m"
+
+
+# ========================================== RESIZE ======================================
+
+def output_mode(mode, fmt):
+    """Mode an image must be converted to before fmt can store it, or None."""
+    if fmt in ["JPEG", "PDF"] and mode in ("RGBA", "P"):
+        return "RGB"
+    return None
+
+
+def prepare_for_format(img, fmt):
+    """Converts modes the output format cannot store."""
+    mode = output_mode(img.mode, fmt)
+    if mode is not None:
+        with stage("convert"):
+            img = img.convert(mode)
+    return img
+
+
+def save_image(img, fp, settings):
+    """Encodes img to a path or file object using the format, quality and DPI rules from settings."""
+    fmt = settings['format']
+    dpi = output_dpi(settings)
+    save_args = {}
+
+    img = prepare_for_format(img, fmt)
+
+    # -----------------------------------DPI Handling for standard formats-----------------------------------
+    if fmt in ["JPEG", "PNG", "BMP", "WEBP"]:
+        save_args['dpi'] = (dpi, dpi)
+
+    if fmt in ["JPEG", "WEBP"]:
+        save_args['quality'] = settings['quality']
+    if fmt == "PNG":
+        save_args['compress_level'] = int(9 - (settings['quality'] / 100) * 9)
+
+    with stage("encode"):
+        if fmt == "PDF":
+            # ------------------------------Use user-defined DPI for PDF resolution-----------------------------
+            img.save(fp, "PDF", resolution=dpi)
+        else:
+            img.save(fp, format=fmt, **save_args)
+
+
+def rotated_size(size, angle):
+    """Size of an image after rotate(-angle, expand=True), for the 0/90/180/270 choices."""
+    if int(angle) % 180 == 90:
+        return size[1], size[0]
+    return size
+
+
+def draft_for_target(img, size):
+    """Lets a JPEG decode at 1/2, 1/4 or 1/8 scale (DCT scaling) while still covering size.
+
+    Must be called before the pixels are loaded; a no-op for other formats. Returns the box
+    to pass to resize() so the reduced image maps exactly onto the original, or None.
+    """
+    res = img.draft(None, size)
+    return res[1] if res else None
+
+
+def source_transpose(img, settings):
+    """The one transpose that applies an opened image's EXIF orientation and then settings['rotate']."""
+    return orientation_transpose(exif_orientation(img), settings['rotate'])
+
+
+def source_geometry(path, settings, page=None):
+    """(pixel size as stored, transpose) of a source from its header; PDF pages are measured at RASTER_BASE_DPI."""
+    if is_pdf(path):
+        return page_size(path, page or 0), orientation_transpose(1, settings['rotate'])
+    with Image.open(path) as img:
+        return img.size, source_transpose(img, settings)
+
+
+def probe_target(path, settings, page=None):
+    """Target (w, h) for a file, from its header only."""
+    size, transpose = source_geometry(path, settings, page)
+    return compute_target_dimensions(transposed_size(size, transpose), settings)
+
+
+def render_pdf_page(path, page, cover):
+    """Rasterizes a PDF page to cover (w, h), in page orientation."""
+    with stage("decode"):
+        return render_page(path, page or 0, cover)
+
+
+def finish_source(img, size, transpose, settings, box=None):
+    """Takes a decoded source to size (w, h), in output orientation, by the plan of planner.plan_operations.
+
+    The resize is left out when img is already at size; box is the region of a reduced-scale decode.
+    """
+    resize = box is not None or img.size != transposed_size(size, transpose)
+    steps = plan_operations(img.size, img.mode, size, transpose, output_mode(img.mode, settings['format']), resize)
+    return run_plan(img, steps, lambda im, s, b: resize_image(im, s, settings, b), box)
+
+
+def decode_to(img, path, size, settings, stream=True):
+    """Decodes an opened source for a resize to size (w, h), in source orientation. Returns (img, box).
+
+    With stream, sources of STREAM_MIN_PIXELS or more are resampled to size in strips (see tiling)
+    and box is None. Otherwise the source is decoded whole, at reduced JPEG scale where size allows
+    (see draft_for_target), and box is the region of that decode to resample.
+    """
+    if not (stream and should_stream(img.size)):
+        box = draft_for_target(img, size)
+        with stage("decode"):
+            img.load()
+        return img, box
+
+    box = None
+    source = open_row_source(path)
+    if source is None:
+        box = draft_for_target(img, size)
+        with stage("decode"):
+            img.load()
+        source = DecodedRows(img)
+
+    # Raw strips are read inside the resampler, so their decode is counted as resize
+    with stage("resize"):
+        return resize_in_strips(source, size, resample_profile(settings)['filter'], box), None
+
+
+def resize_source(path, settings, page=None):
+    """Opens, resizes and orients a source to its target; returns (img, (w, h)).
+
+    EXIF orientation and rotate are one lossless transpose, run on whichever side of the resize has
+    fewer pixels, followed by any mode conversion the output format needs (see planner). Sources of
+    STREAM_MIN_PIXELS or more are resampled in strips, so peak memory follows the strip height
+    instead of the source area (see tiling). PDF pages are rasterized at the lowest DPI that covers
+    the target.
+    """
+    if is_pdf(path):
+        size, transpose = source_geometry(path, settings, page)
+        w, h = compute_target_dimensions(transposed_size(size, transpose), settings)
+        img = render_pdf_page(path, page, transposed_size((w, h), transpose))
+        return finish_source(img, (w, h), transpose, settings), (w, h)
+
+    with stage("open"):
+        img = Image.open(path)
+    transpose = source_transpose(img, settings)
+    w, h = compute_target_dimensions(transposed_size(img.size, transpose), settings)
+    img, box = decode_to(img, path, transposed_size((w, h), transpose), settings)
+    return finish_source(img, (w, h), transpose, settings, box), (w, h)
+
+
+def resize(path, settings, page=None):
+    """Resizes one file (or one page of a PDF, default the first) into memory. Never raises;
+    failures are reported in result['error'].
+
+    The result dict has: path, page, name (output name without extension), ext, width, height,
+    data (encoded bytes) and error. With settings['max_kb'] set, the output is fitted under
+    that size (see fit_file_size) and width/height report the size actually written.
+    """
+    result = _new_result(path, settings, page)
+    try:
+        if settings['format'] in ANIMATED_FORMATS and not is_pdf(path):
+            with Image.open(path) as src:
+                if is_animated(src):
+                    _encode_animation(result, src, settings)
+                    return result
+
+        img, _ = resize_source(path, settings, page)
+        _encode_result(result, img, settings)
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def _new_result(path, settings, page=None):
+    if page is None and is_pdf(path): page = 0
+    return {'path': path, 'page': page, 'name': None, 'ext': output_extension(settings['format']),
+            'width': 0, 'height': 0, 'data': None, 'error': None}
+
+
+def _encode_result(result, img, settings):
+    if settings.get('max_kb'):
+        img, data = fit_file_size(img, settings, int(settings['max_kb'] * 1024))
+    else:
+        data = encode_image(img, settings)
+
+    _finish_result(result, img.size, data, settings)
+
+
+def _finish_result(result, size, data, settings):
+    w, h = size
+    base_name = os.path.splitext(os.path.basename(result['path']))[0]
+    if result['page'] is not None:
+        # Page-number token, zero-padded so outputs sort in page order
+        base_name = f"{base_name}_p{result['page'] + 1:03d}"
+    result.update(name=build_output_name(base_name, w, h, settings), width=w, height=h, data=data)
+
+
+def resize_animation(img, settings):
+    """Resizes and orients every frame of an animated source. Returns (frames, save_all args)."""
+    transpose = source_transpose(img, settings)
+    size = compute_target_dimensions(transposed_size(img.size, transpose), settings)
+    steps = plan_operations(img.size, "RGBA", size, transpose)
+
+    def resize_frame(frame):
+        return run_plan(frame, steps, lambda im, s, b: resize_image(im, s, settings, b))
+
+    gif = settings['format'] == "GIF"
+    frames, durations, disposal = resize_frames(img, resize_frame, gif,
+                                                settings.get('frame_workers') or settings.get('workers'))
+    return frames, animation_save_args(img, settings['format'], durations, disposal)
+
+
+def _encode_animation(result, img, settings):
+    """Animated output keeps every frame; max_kb is not applied to animations."""
+    # Frames are decoded, resized and transposed together on the frame threads
+    with stage("resize"):
+        frames, save_args = resize_animation(img, settings)
+    if settings['format'] == "WEBP":
+        save_args['quality'] = settings['quality']
+    buffer = io.BytesIO()
+    with stage("encode"):
+        frames[0].save(buffer, format=settings['format'], append_images=frames[1:], **save_args)
+    _finish_result(result, frames[0].size, buffer.getvalue(), settings)
+
+
+# ========================================== MULTI-OUTPUT ======================================
+
+# Settings each entry of settings['outputs'] may override; rotate and workers stay per job
+OUTPUT_KEYS = ['width', 'height', 'unit', 'keep_ratio', 'format', 'quality', 'rename_option', 'suffix',
+               'dpi', 'max_kb', 'resample']
+# A derived output is only resampled from an earlier one at least this much larger in both dimensions
+CASCADE_MIN_RATIO = 2.0
+
+
+def output_spec(settings):
+    """The per-output part of settings, for use as an entry of settings['outputs']."""
+    return {key: settings[key] for key in OUTPUT_KEYS if key in settings}
+
+
+def decode_for_targets(path, settings, cover, page=None):
+    """Decodes a source once so it covers every target up to cover (w, h), in output orientation.
+
+    Returns (img, box, transpose): img stays in source orientation, box is the region of a
+    reduced-scale decode (or None) and transpose orients the outputs. Sources big enough for the
+    strip resampler are first reduced in strips to CASCADE_MIN_RATIO x cover; PDF pages are
+    rasterized to cover.
+    """
+    if is_pdf(path):
+        transpose = orientation_transpose(1, settings['rotate'])
+        return render_pdf_page(path, page, transposed_size(cover, transpose)), None, transpose
+
+    with stage("open"):
+        img = Image.open(path)
+    transpose = source_transpose(img, settings)
+    src_cover = transposed_size(cover, transpose)
+
+    scale = max(src_cover[0] * CASCADE_MIN_RATIO / img.width, src_cover[1] * CASCADE_MIN_RATIO / img.height)
+    if should_stream(img.size) and scale < 1.0:
+        img, box = decode_to(img, path, (max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                             settings)
+    else:
+        img, box = decode_to(img, path, src_cover, settings, stream=False)
+    return img, box, transpose
+
+
+def resize_many(path, settings, page=None):
+    """Decode once, write many: one result per entry of settings['outputs'], in that order.
+
+    Each entry overrides OUTPUT_KEYS of settings. The source is decoded once, then targets are
+    produced largest to smallest, each resampled from the smallest earlier output that is still
+    CASCADE_MIN_RATIO times larger (or from the source). The cascade stays in source orientation;
+    each output is transposed and converted on its own, after its resize.
+    """
+    jobs = [dict(settings, **output) for output in settings['outputs']]
+    if not is_pdf(path) and any(job['format'] in ANIMATED_FORMATS for job in jobs):
+        # Animations are resized frame by frame per target instead of through the cascade
+        try:
+            with Image.open(path) as src:
+                animated = is_animated(src)
+        except Exception:
+            animated = False
+        if animated:
+            return [resize(path, job, page) for job in jobs]
+
+    results = [_new_result(path, job, page) for job in jobs]
+    try:
+        size, transpose = source_geometry(path, settings, page)
+        targets = [compute_target_dimensions(transposed_size(size, transpose), job) for job in jobs]
+        cover = (max(w for w, _ in targets), max(h for _, h in targets))
+        base, box, transpose = decode_for_targets(path, settings, cover, page)
+    except Exception as e:
+        for result in results:
+            result['error'] = str(e)
+        return results
+
+    cascade = []
+    for i in sorted(range(len(jobs)), key=lambda i: targets[i][0] * targets[i][1], reverse=True):
+        w, h = transposed_size(targets[i], transpose)
+        try:
+            src = next((level for level in reversed(cascade)
+                        if level.width >= w * CASCADE_MIN_RATIO and level.height >= h * CASCADE_MIN_RATIO), None)
+            if src is None:
+                img = resize_image(base, (w, h), jobs[i], box)
+            else:
+                img = resize_image(src, (w, h), jobs[i])
+            cascade.append(img)
+            _encode_result(results[i], finish_source(img, targets[i], transpose, jobs[i]), jobs[i])
+        except Exception as e:
+            results[i]['error'] = str(e)
+    return results
+
+
+def _draft_size(size, cover, fmt):
+    """Size draft_for_target() gives a source of fmt: JPEGs decode at 1/2, 1/4 or 1/8 scale."""
+    if fmt != "JPEG":
+        return size
+    scale = min(size[0] // max(1, cover[0]), size[1] // max(1, cover[1]))
+    for s in (8, 4, 2):
+        if scale >= s:
+            return (size[0] + s - 1) // s, (size[1] + s - 1) // s
+    return size
+
+
+def estimate_task_bytes(task, settings):
+    """Rough peak memory in bytes of process_task(task, settings), from the header only.
+
+    Counts the decoded source (at draft scale; one strip for raw BMP in the strip resampler),
+    a premultiplied copy for sources with alpha, the horizontal resampling pass, and every output
+    twice (a transpose or conversion copy, then the encoded buffer). Animations hold all their
+    resized frames until the save.
+    """
+    path, page = task
+    jobs = [dict(settings, **output) for output in settings.get('outputs') or [{}]]
+    frames = 1
+    if is_pdf(path):
+        size, transpose = source_geometry(path, settings, page)
+        mode, fmt = "RGB", "PDF"
+    else:
+        with Image.open(path) as img:
+            size, mode, fmt = img.size, img.mode, img.format
+            transpose = source_transpose(img, settings)
+            if any(job['format'] in ANIMATED_FORMATS for job in jobs):
+                frames = getattr(img, 'n_frames', 1)
+
+    targets = [compute_target_dimensions(transposed_size(size, transpose), job) for job in jobs]
+    cover = transposed_size((max(w for w, _ in targets), max(h for _, h in targets)), transpose)
+    outputs = sum(w * h for w, h in targets) * 4
+    if frames > 1:
+        # Decoded RGBA frame plus every resized frame, RGBA and palette copies
+        return size[0] * size[1] * 4 + frames * outputs * 2
+
+    if fmt == "PDF":
+        decoded_size = cover
+    elif should_stream(size) and fmt in RAW_STRIP_FORMATS:
+        # A strip as read, plus its crop
+        decoded_size = (size[0], 2 * STRIP_SOURCE_ROWS)
+    else:
+        decoded_size = _draft_size(size, cover, fmt)
+    decoded = decoded_size[0] * decoded_size[1] * mode_bytes(mode)
+    if mode in ("RGBA", "LA"):
+        decoded *= 2
+    horizontal_pass = cover[0] * decoded_size[1] * 4
+    return decoded + horizontal_pass + 2 * outputs
+
+
+def expand_tasks(paths):
+    """Batch tasks as (path, page): one per image and one per PDF page, in input order."""
+    tasks = []
+    for path in paths:
+        if is_pdf(path):
+            try:
+                tasks.extend((path, page) for page in range(page_count(path)))
+                continue
+            except Exception:
+                pass  # the task below reports the error
+        tasks.append((path, None))
+    return tasks
+
+
+def input_size(path):
+    """Size of an input file in bytes, 0 when it cannot be read (its task reports the error)."""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def process_task(task, settings):
+    """Batch worker task: the list of results for one image or PDF page.
+
+    The first result carries the task's run time in seconds as 'elapsed'.
+    """
+    path, page = task
+    started = time.perf_counter()
+    if not settings.get('metrics'):
+        results = resize_many(path, settings, page) if settings.get('outputs') else [resize(path, settings, page)]
+    else:
+        # Stage timings of the whole task travel back on its first result
+        with recording() as timings:
+            results = resize_many(path, settings, page) if settings.get('outputs') else [resize(path, settings, page)]
+        results[0]['metrics'] = {'timings': timings, 'bytes_in': input_size(path)}
+    results[0]['elapsed'] = time.perf_counter() - started
+    return results
+
+
+# ========================================== TARGET FILE SIZE ======================================
+
+QUALITY_FORMATS = ["JPEG", "WEBP"]
+MIN_SEARCH_QUALITY = 10
+HINT_BRACKET = 4
+MAX_DOWNSCALE_STEPS = 8
+
+# Last quality that fitted, per (format, byte limit, pixel-count magnitude). Lives per process,
+# so each pool worker learns from the files it has already done in the batch.
+_quality_hints = {}
+
+
+def encode_image(img, settings, **overrides):
+    buffer = io.BytesIO()
+    save_image(img, buffer, dict(settings, **overrides) if overrides else settings)
+    return buffer.getvalue()
+
+
+def _search_quality(encode, max_bytes, lo, hi, hint):
+    """Highest quality in [lo, hi] whose encoding fits. Returns (quality, data) or (None, smallest data)."""
+    best, smallest = None, None
+
+    def fits(q):
+        nonlocal best, smallest
+        data = encode(q)
+        if len(data) <= max_bytes:
+            if best is None or q > best[0]: best = (q, data)
+            return True
+        if smallest is None or len(data) < len(smallest): smallest = data
+        return False
+
+    if fits(hi):
+        return best
+    hi -= 1
+
+    # -----------------------------------Narrow the bracket around the last answer first:
+    # hint and its neighbour settle an unchanged boundary, then +-HINT_BRACKET bounds a shifted one
+    if hint is not None and lo <= hint <= hi:
+        step = 1 if fits(hint) else -1
+        if step > 0: lo = hint + 1
+        else: hi = hint - 1
+        for offset in (1, HINT_BRACKET):
+            probe = hint + step * offset
+            if not lo <= probe <= hi:
+                break
+            ok = fits(probe)
+            if ok: lo = probe + 1
+            else: hi = probe - 1
+            if ok != (step > 0):
+                break  # crossed the boundary
+
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if fits(mid): lo = mid + 1
+        else: hi = mid - 1
+
+    return best if best is not None else (None, smallest)
+
+
+def fit_file_size(img, settings, max_bytes):
+    """Encodes img under max_bytes; returns (img, data). Raises ValueError if it cannot fit.
+
+    JPEG/WEBP search quality between MIN_SEARCH_QUALITY and the quality setting, PNG tries maximum
+    compression, and anything still too large is downscaled. Every step re-encodes the already
+    resized pixels; nothing is decoded again.
+    """
+    fmt = settings['format']
+    base = img = prepare_for_format(img, fmt)
+
+    for _ in range(MAX_DOWNSCALE_STEPS):
+        if fmt in QUALITY_FORMATS:
+            hint_key = (fmt, max_bytes, (img.width * img.height).bit_length())
+            quality, data = _search_quality(lambda q: encode_image(img, settings, quality=q), max_bytes,
+                                            MIN_SEARCH_QUALITY, settings['quality'], _quality_hints.get(hint_key))
+            if quality is not None:
+                _quality_hints[hint_key] = quality
+                return img, data
+        else:
+            data = encode_image(img, settings)
+            if len(data) <= max_bytes:
+                return img, data
+            if fmt == "PNG":
+                # Quality 0 maps to compress_level 9
+                data = encode_image(img, settings, quality=0)
+                if len(data) <= max_bytes:
+                    return img, data
+
+        if img.width == 1 and img.height == 1:
+            break
+        # -----------------------------------Shrink by the area ratio, always from the first resize
+        scale = math.sqrt(max_bytes / len(data)) * 0.95
+        size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+        img = resize_image(base, size, settings)
+
+    raise ValueError(f"Could not fit under {format_size(max_bytes)}")
+
+
+# ========================================== BATCH ======================================
+
+# Tasks submitted or finished but not yet written, per worker
+TASKS_AHEAD = 8
+# Threads reading input files ahead of the workers, and how many tasks per worker they may run ahead
+PREFETCH_THREADS = 4
+PREFETCH_AHEAD = 2
+# Finished tasks per worker waiting for the writer thread
+WRITE_AHEAD = 2
+
+
+class BatchProgress:
+    """Counters of a running batch, handed to the progress callback after every task."""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.skipped = 0
+        self.failures = []
+        self.started = time.monotonic()
+
+    def rate(self):
+        """Tasks per second, not counting tasks skipped from the journal."""
+        elapsed = time.monotonic() - self.started
+        return (self.done - self.skipped) / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        """Seconds left at the current rate, or None until a task has finished."""
+        rate = self.rate()
+        return (self.total - self.done) / rate if rate > 0 else None
+
+
+def worker_pool(workers):
+    """Process pool for batch work. Workers are spawned, not forked, so they never inherit the Tk process."""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def iter_task_results(tasks, settings, workers, clock=None):
+    """Yields process_task() result lists for (path, page) tasks, in order.
+
+    Prefetch threads read each input file into the OS cache and estimate its memory a few tasks
+    ahead of the pool (see pipeline). Tasks then enter the pool under admission control (see
+    admission): only while the estimated peak memory of the running tasks fits the budget from
+    settings['memory_mb'] or, by default, a share of available memory. With a pipeline.PipelineClock
+    passed, the prefetch threads' busy time is added to it.
+    """
+    # Workers left over when there are fewer tasks than workers resize animation frames in threads
+    settings = dict(settings, frame_workers=max(1, workers // max(1, len(tasks))))
+    workers = max(1, min(workers, len(tasks)))
+    budget = memory_budget(settings) if workers > 1 else None
+    read = set()
+
+    def read_ahead(task):
+        try:
+            # A PDF is read once for all its page tasks
+            if task[0] not in read:
+                read.add(task[0])
+                read_through(task[0])
+            return estimate_task_bytes(task, settings) if budget is not None else 0
+        except Exception:
+            return 0  # unreadable file: the task fails fast in its worker
+
+    prefetched = prefetch(tasks, read_ahead, min(PREFETCH_THREADS, workers), workers * PREFETCH_AHEAD, clock)
+    try:
+        if workers == 1:
+            for task, _ in prefetched:
+                yield process_task(task, settings)
+            return
+
+        with worker_pool(workers) as pool:
+            yield from admit_in_order(pool, process_task, prefetched, (settings,), budget, workers * TASKS_AHEAD)
+    finally:
+        prefetched.close()
+
+
+def run_batch(paths, settings, output_dir, workers=None, resume=True, progress=None, cancel=None, metrics=None):
+    """Resizes paths into output_dir. Returns (success_count, [(path, error), ...]).
+
+    Runs as a pipeline (see pipeline): prefetch threads read inputs ahead, worker processes decode,
+    resize and encode into memory, and a writer thread names and writes the results, with bounded
+    queues in between.
+
+    Outputs are named from an in-memory index of output_dir and written atomically, with fsyncs
+    batched (see output_writer). An output_dir ending in .zip, .tar, .tar.gz or .tgz is an archive
+    instead: every output is streamed into it as an entry, and archives are not journaled or
+    resumed. An existing archive is never replaced (pick a free name with
+    output_writer.free_archive_path); the archive is published when the batch finishes or is
+    cancelled, is deleted if the batch fails, and its entries count as successes only once it is
+    in place. Otherwise progress is journaled in output_dir (see journal.BatchJournal): a task is
+    marked done once its outputs are synced. With resume on, tasks a previous run finished with the
+    same settings are skipped and counted as successes, and unfinished ones are written back to the
+    paths they claimed.
+
+    progress(BatchProgress) is called after every task, from the writer thread. Setting the cancel
+    event stops the batch between tasks; finished outputs stay, and the journal lets a later run
+    pick up the rest.
+
+    With a metrics.StageMetrics passed, per-stage timings of every task and the utilization of
+    each pipeline stage are added to it.
+    """
+    workers = workers or settings.get('workers') or os.cpu_count() or 1
+    if metrics is not None:
+        settings = dict(settings, metrics=True)
+    success_count = 0
+    clock = PipelineClock()
+    if is_archive(output_dir):
+        journal, output = NoJournal(), ArchiveWriter(output_dir)
+    else:
+        journal, output = BatchJournal(output_dir, settings, resume), OutputWriter(output_dir)
+    # Tasks whose outputs are written but not yet synced: (task, output paths, result count)
+    uncommitted = []
+    results_iter = writer = None
+    completed = False
+
+    def commit(close=False):
+        nonlocal success_count
+        failed = output.flush()
+        if close:
+            failed.update(output.close(publish=completed))
+        for task, outputs, count in uncommitted:
+            synced = [path for path in outputs if path not in failed]
+            errors.extend((task[0], failed[path]) for path in outputs if path in failed)
+            success_count += len(synced)
+            if len(synced) == count:
+                journal.complete(task, synced)
+        uncommitted.clear()
+
+    def commit_if_due():
+        if output.due():
+            commit()
+
+    try:
+        all_tasks = expand_tasks(list(paths))
+        state = BatchProgress(len(all_tasks))
+        errors = state.failures
+        tasks = []
+        for task in all_tasks:
+            if journal.is_done(task):
+                success_count += len(settings.get('outputs') or [None])
+                state.done += 1
+                state.skipped += 1
+            else:
+                tasks.append(task)
+                try:
+                    for path in journal.claimed(task).values():
+                        output.names.claim(path)
+                except OSError:
+                    pass
+        if progress is not None:
+            progress(state)
+
+        def write_task(item):
+            # One task at a time in input order, so names and _N suffixes are deterministic
+            task, results = item
+            if cancel is not None and cancel.is_set():
+                return
+            try:
+                claimed = journal.claimed(task)
+            except OSError:
+                claimed = {}
+            outputs = []
+            with recording() if metrics is not None else nullcontext() as written:
+                for i, result in enumerate(results):
+                    if result['error'] is not None:
+                        errors.append((result['path'], result['error']))
+                        continue
+                    try:
+                        if i in claimed:
+                            out_path = claimed[i]
+                        else:
+                            out_path = output.names.reserve(result['name'], result['ext'])
+                            journal.claim(task, i, out_path)
+                        output.write(out_path, result['data'])
+                        outputs.append(out_path)
+                    except Exception as e:
+                        errors.append((result['path'], str(e)))
+                uncommitted.append((task, outputs, len(results)))
+                commit_if_due()
+
+            if metrics is not None:
+                info = results[0].get('metrics') or {'timings': {}, 'bytes_in': 0}
+                metrics.add(task[0], task[1], dict(info['timings'], **written), info['bytes_in'],
+                            sum(len(r['data']) for r in results if r['data'] is not None))
+            state.done += 1
+            if progress is not None:
+                progress(state)
+
+        workers = max(1, min(workers, len(tasks)))
+        # Declared in pipeline order, for the report
+        clock.stage("prefetch", min(PREFETCH_THREADS, workers))
+        clock.stage("compute", workers)
+        # The idle check syncs the last outputs of a slow batch without waiting for its next result
+        writer = StageThread(write_task, workers * WRITE_AHEAD, clock, "write", commit_if_due, SYNC_SECONDS)
+        results_iter = iter_task_results(tasks, settings, workers, clock)
+        waiting = time.perf_counter()
+        for task, results in zip(tasks, results_iter):
+            clock.add_wait("results", time.perf_counter() - waiting)
+            clock.add("compute", results[0].get('elapsed', 0.0))
+            writer.put((task, results))
+            if cancel is not None and cancel.is_set():
+                break
+            waiting = time.perf_counter()
+        completed = True
+    finally:
+        try:
+            if results_iter is not None:
+                # Drops queued tasks; only those already running in a worker are waited for
+                results_iter.close()
+            if writer is not None:
+                writer.close()
+        except BaseException:
+            completed = False
+            raise
+        finally:
+            try:
+                commit(close=True)
+            finally:
+                journal.close()
+    if metrics is not None:
+        metrics.pipeline = clock.report()
+
+    return success_count, errors
@@ -0,0 +1,69 @@
+"""Model behind the file list: ordered paths with their Treeview rows, header info and thumbnails."""
+
+
+class FileList:
+    """Ordered, de-duplicated files with O(1) lookups by path and by Treeview item id.
+
+    paths, iids and thumbnails are parallel lists indexed by row. Removing any number of rows is
+    a single O(n) compaction. add() appends in place and nothing here is locked, so a FileList is
+    only used on the Tk thread; another thread gets a copy, list(files), taken there.
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.paths = []
+        self.iids = []
+        # Per row: PhotoImage, None (not made yet) or False (unreadable)
+        self.thumbnails = []
+        # Header info per path: (width, height, mode, format), None when unreadable
+        self.info = {}
+        self._index = {}
+        self._iid_paths = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, path):
+        return path in self._index
+
+    def __getitem__(self, idx):
+        return self.paths[idx]
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def add(self, path, iid, info):
+        self._index[path] = len(self.paths)
+        self._iid_paths[iid] = path
+        self.paths.append(path)
+        self.iids.append(iid)
+        self.thumbnails.append(None if info else False)
+        self.info[path] = info
+
+    def index(self, path):
+        """Row of path, or None if it is not in the list (e.g. removed meanwhile)."""
+        return self._index.get(path)
+
+    def index_of_iid(self, iid):
+        path = self._iid_paths.get(iid)
+        return None if path is None else self._index[path]
+
+    def remove_iids(self, iids):
+        """Drops the rows of the given Treeview item ids (unknown ids are ignored). Returns the removed paths."""
+        drop = set()
+        for iid in iids:
+            path = self._iid_paths.pop(iid, None)
+            if path is not None:
+                drop.add(self._index.pop(path))
+                del self.info[path]
+        if not drop:
+            return []
+        removed = [self.paths[i] for i in sorted(drop)]
+        keep = [i for i in range(len(self.paths)) if i not in drop]
+        self.paths = [self.paths[i] for i in keep]
+        self.iids = [self.iids[i] for i in keep]
+        self.thumbnails = [self.thumbnails[i] for i in keep]
+        self._index = {path: i for i, path in enumerate(self.paths)}
+        return removed
@@ -0,0 +1,110 @@
+"""Checkpoint journal that lets an interrupted batch resume where it stopped.
+
+The journal is an append-only JSON-lines file in the output folder. Each task (an image or one
+PDF page) is keyed by its input path, page, mtime, size and a hash of the settings that decide
+what it writes, so the GUI and the command line resume each other's batches. Before an
+output is written its path is claimed; once every output of a task is written the task is marked
+done. A re-run skips done tasks and writes unfinished ones back to the paths they claimed, so it
+produces the same names as a run that was never interrupted.
+"""
+import hashlib
+import json
+import os
+
+JOURNAL_NAME = ".resize-journal.jsonl"
+# Settings that change what a batch writes: engine.OUTPUT_KEYS plus rotate and the per-target outputs.
+# Everything else (workers, merge options, metrics, memory budget) only changes how a batch runs.
+HASHED_KEYS = ('width', 'height', 'unit', 'keep_ratio', 'format', 'quality', 'rename_option', 'suffix',
+               'dpi', 'max_kb', 'resample', 'rotate', 'outputs')
+
+
+def settings_hash(settings):
+    stable = {k: settings.get(k) for k in HASHED_KEYS}
+    return hashlib.sha1(json.dumps(stable, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class BatchJournal:
+    """Journal for one output folder and one set of settings. With resume off, earlier entries are ignored."""
+
+    def __init__(self, output_dir, settings, resume=True):
+        self.path = os.path.join(output_dir, JOURNAL_NAME)
+        self.settings = settings_hash(settings)
+        self._done = set()
+        self._claims = {}
+        self._keys = {}
+        if resume and os.path.exists(self.path):
+            self._load()
+        self._fp = open(self.path, 'a', encoding='utf-8')
+        if self._fp.tell() and not self._ends_with_newline():
+            self._fp.write("\n")  # start after a line cut short by a crash
+
+    def _load(self):
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    key = tuple(entry['key'])
+                except (ValueError, KeyError, TypeError):
+                    continue  # a line cut short by a crash
+                if key[-1] != self.settings:
+                    continue
+                if 'claim' in entry:
+                    self._claims.setdefault(key, {})[entry.get('output', 0)] = entry['claim']
+                elif entry.get('done'):
+                    self._done.add(key)
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def key(self, task):
+        """(input path, page, mtime_ns, size, settings hash) for a (path, page) task."""
+        key = self._keys.get(task)
+        if key is None:
+            path, page = task
+            st = os.stat(path)
+            key = self._keys[task] = (os.path.abspath(path), page, st.st_mtime_ns, st.st_size, self.settings)
+        return key
+
+    def is_done(self, task):
+        try:
+            return self.key(task) in self._done
+        except OSError:
+            return False
+
+    def claimed(self, task):
+        """{result index: output path} an earlier, unfinished run claimed for this task."""
+        return self._claims.get(self.key(task), {})
+
+    def claim(self, task, index, out_path):
+        self._write({'key': self.key(task), 'output': index, 'claim': out_path})
+
+    def complete(self, task, outputs):
+        self._write({'key': self.key(task), 'done': True, 'outputs': outputs})
+
+    def _write(self, entry):
+        self._fp.write(json.dumps(entry) + "\n")
+        self._fp.flush()
+
+    def close(self):
+        self._fp.close()
+
+
+class NoJournal:
+    """Journal stand-in for targets a batch cannot resume into, such as archives: nothing is recorded."""
+
+    def is_done(self, task):
+        return False
+
+    def claimed(self, task):
+        return {}
+
+    def claim(self, task, index, out_path):
+        pass
+
+    def complete(self, task, outputs):
+        pass
+
+    def close(self):
+        pass
@@ -3,10 +3,22 @@ from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk, ImageDraw
 import os
 import threading
-import glob
-import io
 import math
 import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from engine import (OUTPUT_FORMATS, RENAME_OPTIONS, RENAME_SIZE, RENAME_SUFFIX,
+                    PRESETS_GENERAL, RESAMPLE_PROFILES, DEFAULT_RESAMPLE, presets_for_format,
+                    compute_target_dimensions, build_output_name, rotated_size, probe_target, resize, run_batch,
+                    output_spec, format_size, format_duration, input_size, default_settings)
+from preview_cache import ImageCache, fit_size, pick_level, load_thumbnail
+from pdf_input import PDF_SUPPORT, is_pdf
+from merge import MERGE_FORMATS, is_merge, run_merged
+from metrics import StageMetrics, recording, stage
+from scan import iter_image_files, probe_header
+from file_list import FileList
+from thumb_cache import open_thumbnail_cache
+from output_writer import free_archive_path, is_archive
 
 # ===========================import Drag and Drop support=========================
 try:
@@ -16,8 +28,30 @@ try:
 except ImportError:
     DND_SUPPORT = False
 
-# Constants
-SUPPORTED_FORMATS = ['.bmp', '.jpg', '.jpeg', '.gif', '.png', '.pdf', '.webp', '.ico']
+
+# Decoded preview images kept in memory (LRU, by bytes)
+PREVIEW_CACHE_BYTES = 256 * 1024 * 1024
+# Quiet time after the last <Configure> before the LANCZOS redraw
+HQ_REDRAW_DELAY_MS = 150
+# Batch stage timings are written here (.json or .csv) when set
+METRICS_PATH = os.environ.get("SANDY_METRICS")
+# File list thumbnails are made lazily for visible rows, plus this many rows either side
+THUMB_MARGIN_ROWS = 20
+THUMB_WORKERS = 2
+# Found files are looked up in the thumbnail cache this many at a time
+LOAD_CHUNK = 256
+# Time per Tk tick spent taking loaded files into the list, so the window keeps redrawing
+INGEST_BUDGET_MS = 8
+# Rows inserted into the Treeview per Tcl call
+INGEST_BATCH = 200
+# Inserts a list of names under the root item in one Tcl round trip; returns the new item ids
+TREE_INSERT_SCRIPT = ("{tree names} {set ids {}; foreach name $names "
+                      "{lappend ids [$tree insert {} end -text $name]}; return $ids}")
+# Quiet time after scrolling before thumbnails are requested
+THUMB_DELAY_MS = 50
+# "Save to" choices for Resize All: a folder, or an archive the outputs are streamed into
+TARGET_FOLDER = "Folder"
+ARCHIVE_TARGETS = {"ZIP archive": ".zip", "TAR archive": ".tar"}
 
 
 # ========================================== LOGO GENERATOR ======================================
@@ -49,24 +83,6 @@ def create_sunflower_image(size=(64, 64)):
     return img
 
 
-# !--- PRESETS ---
-PRESETS_GENERAL = {
-    "Custom": (0, 0), "1:1 (Square - 1080x1080)": (1080, 1080),
-    "4:3 (Standard - 1440x1080)": (1440, 1080), "3:2 (Photo - 1440x960)": (1440, 960),
-    "16:9 (Widescreen - 1920x1080)": (1920, 1080), "21:9 (Ultra-Wide - 2560x1080)": (2560, 1080),
-    "Passport Photo (35x45 mm)": (35, 45), "HD Wallpaper (1920x1080)": (1920, 1080),
-    "4K Wallpaper (3840x2160)": (3840, 2160), "Instagram Post (1080x1080)": (1080, 1080),
-}
-PRESETS_PDF = {
-    "Custom": (0, 0), "A4 (210x297 mm)": (210, 297), "A3 (297x420 mm)": (297, 420),
-    "A5 (148x210 mm)": (148, 210), "Letter (216x279 mm)": (216, 279),
-}
-PRESETS_ICO = {
-    "Custom": (0, 0), "16x16 px": (16, 16), "32x32 px": (32, 32),
-    "64x64 px": (64, 64), "256x256 px": (256, 256),
-}
-
-
 class SandyResizerApp:
     def __init__(self, root):
         self.root = root
@@ -79,8 +95,7 @@ class SandyResizerApp:
         self.logo_photo = ImageTk.PhotoImage(self.logo_image)
         self.root.iconphoto(True, self.logo_photo)
 
-        self.image_list = []
-        self.thumbnails = []
+        self.files = FileList()
 
         self.current_preview_index = 0
         self.preview_running = False
@@ -90,15 +105,34 @@ class SandyResizerApp:
         self.orig_img_ratio = 0
 
         # Cache for responsive resizing
-        self.cached_preview_img = None
+        self.preview_levels = None
+        self.hq_redraw_job = None
+        self.preview_cache = ImageCache(PREVIEW_CACHE_BYTES,
+                                        (self.root.winfo_screenwidth(), self.root.winfo_screenheight()))
+
+        # Output specs for Resize All; empty means "current settings only"
+        self.batch_outputs = []
 
         self.loading_queue = queue.Queue()
         self.is_loading = False
 
+        # Lazy file list thumbnails, made on a small thread pool and drained on the Tk loop
+        self.thumb_pool = ThreadPoolExecutor(max_workers=THUMB_WORKERS)
+        self.thumb_queue = queue.Queue()
+        self.thumb_pending = set()
+        self.thumb_job = None
+        # Headers and thumbnails persisted between sessions; None if the cache cannot be opened
+        self.thumb_cache = open_thumbnail_cache()
+
+        # Resize All progress, fed from the batch thread and drained on the Tk loop
+        self.progress_queue = queue.Queue()
+        self.batch_cancel = None
+
         self.setup_ui()
         self.load_ui_settings()
 
         self.root.after(100, self.start_preview_loop)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def setup_ui(self):
         main_frame = ttk.Frame(self.root, padding="10")
@@ -131,9 +165,9 @@ class SandyResizerApp:
         self.file_tree = ttk.Treeview(tree_frame, selectmode='extended', show='tree')
         self.file_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.file_tree.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.file_tree.configure(yscrollcommand=scrollbar.set)
+        self.tree_scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.file_tree.yview)
+        self.tree_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.file_tree.configure(yscrollcommand=self.on_tree_scroll)
 
         self.file_tree.column("#0", width=230, minwidth=200)
         self.file_tree.bind('<<TreeviewSelect>>', self.on_tree_select)
@@ -176,7 +210,7 @@ class SandyResizerApp:
         ttk.Label(self.file_frame, text="Format:").grid(row=0, column=0, sticky='w')
         self.format_var = tk.StringVar(value="JPEG")
         self.format_combo = ttk.Combobox(self.file_frame, textvariable=self.format_var,
-                                         values=["JPEG", "PNG", "WEBP", "GIF", "BMP", "ICO", "PDF"], state="readonly")
+                                         values=OUTPUT_FORMATS, state="readonly")
         self.format_combo.grid(row=0, column=1, sticky='ew')
         self.format_combo.bind("<<ComboboxSelected>>", self.on_format_change)
 
@@ -185,6 +219,40 @@ class SandyResizerApp:
         ttk.Combobox(self.file_frame, textvariable=self.rotate_var, values=["0", "90", "180", "270"],
                      state="readonly").grid(row=1, column=1, sticky='ew', pady=2)
 
+        ttk.Label(self.file_frame, text="Resampling:").grid(row=2, column=0, sticky='w', pady=2)
+        self.resample_var = tk.StringVar(value=DEFAULT_RESAMPLE)
+        self.resample_combo = ttk.Combobox(self.file_frame, textvariable=self.resample_var,
+                                           values=list(RESAMPLE_PROFILES), state="readonly")
+        self.resample_combo.grid(row=2, column=1, sticky='ew', pady=2)
+        self.resample_combo.bind("<<ComboboxSelected>>", lambda e: self.update_preview())
+
+        ttk.Label(self.file_frame, text="Workers:").grid(row=3, column=0, sticky='w', pady=2)
+        self.workers_var = tk.StringVar(value=str(os.cpu_count() or 1))
+        ttk.Spinbox(self.file_frame, textvariable=self.workers_var, from_=1, to=max(64, os.cpu_count() or 1),
+                    width=5).grid(row=3, column=1, sticky='ew', pady=2)
+
+        # !-------------------------Multi-output queue (decode once, write many)-------------------------
+        self.outputs_var = tk.StringVar(value="Outputs: current settings")
+        ttk.Label(self.file_frame, textvariable=self.outputs_var).grid(row=4, column=0, columnspan=2, sticky='w',
+                                                                       pady=(5, 0))
+        outputs_btn_frame = ttk.Frame(self.file_frame)
+        outputs_btn_frame.grid(row=5, column=0, columnspan=2, sticky='ew')
+        ttk.Button(outputs_btn_frame, text="Add as Output", command=self.add_batch_output).pack(side=tk.LEFT,
+                                                                                               expand=True,
+                                                                                               fill=tk.X)
+        ttk.Button(outputs_btn_frame, text="Clear", command=self.clear_batch_outputs).pack(side=tk.LEFT, padx=(2, 0))
+
+        # !-------------------------Merged output (one PDF / animated GIF or WebP)-------------------------
+        self.merge_var = tk.BooleanVar(value=False)
+        self.merge_check = ttk.Checkbutton(self.file_frame, text="Merge into one file", variable=self.merge_var)
+        self.merge_check.grid(row=6, column=0, columnspan=2, sticky='w', pady=(5, 0))
+
+        # !-------------------------Batch target (folder or ZIP/TAR archive)-------------------------
+        ttk.Label(self.file_frame, text="Save to:").grid(row=7, column=0, sticky='w', pady=2)
+        self.target_var = tk.StringVar(value=TARGET_FOLDER)
+        ttk.Combobox(self.file_frame, textvariable=self.target_var, values=[TARGET_FOLDER, *ARCHIVE_TARGETS],
+                     state="readonly", width=12).grid(row=7, column=1, sticky='ew', pady=2)
+
         # 2. RESIZE DIMENSIONS
         self.dim_frame = ttk.LabelFrame(right_frame, text="Resize Dimensions", padding="10")
         self.dim_frame.pack(fill=tk.X, pady=5)
@@ -269,6 +337,12 @@ class SandyResizerApp:
         calc_frame.pack(fill=tk.X, pady=5)
         self.calculated_size_var = tk.StringVar(value="Size: --")
         ttk.Label(calc_frame, textvariable=self.calculated_size_var, font=("Arial", 10, "bold")).pack(pady=5)
+
+        limit_frame = ttk.Frame(calc_frame)
+        limit_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(limit_frame, text="Max size (KB, 0 = off):").pack(side=tk.LEFT)
+        self.max_kb_var = tk.StringVar(value="0")
+        ttk.Entry(limit_frame, textvariable=self.max_kb_var, width=8).pack(side=tk.RIGHT)
         ttk.Button(calc_frame, text="Check Size (Process)", command=self.calculate_buffer_size).pack(fill=tk.X)
 
         # 5. -----------------------------------FILENAME SETTINGS-----------------------------------
@@ -278,10 +352,9 @@ class SandyResizerApp:
         self.name_frame.columnconfigure(1, weight=1)
 
         ttk.Label(self.name_frame, text="Rename:").grid(row=0, column=0, sticky='w', padx=5)
-        self.rename_var = tk.StringVar(value="[Original Name]_[Width]×[Height]")
+        self.rename_var = tk.StringVar(value=RENAME_SIZE)
         self.rename_combo = ttk.Combobox(self.name_frame, textvariable=self.rename_var,
-                                         values=["Original Name", "[Original Name]_[Width]×[Height]", "Add Suffix"],
-                                         state="readonly")
+                                         values=RENAME_OPTIONS, state="readonly")
         self.rename_combo.grid(row=0, column=1, sticky='ew', padx=5)
         self.rename_combo.bind("<<ComboboxSelected>>", self.on_rename_option_change)
 
@@ -295,22 +368,38 @@ class SandyResizerApp:
         action_frame.pack(fill=tk.X, side=tk.BOTTOM, pady=10)
 
         ttk.Button(action_frame, text="Resize", command=self.resize_single).pack(fill=tk.X, pady=2)
-        ttk.Button(action_frame, text="Resize All", command=self.start_resize_thread).pack(fill=tk.X, pady=2)
+        self.btn_resize_all = ttk.Button(action_frame, text="Resize All", command=self.start_resize_thread)
+        self.btn_resize_all.pack(fill=tk.X, pady=2)
+
+        self.batch_progress = ttk.Progressbar(action_frame, mode='determinate')
+        self.batch_progress.pack(fill=tk.X, pady=2)
+        self.batch_status_var = tk.StringVar(value="")
+        ttk.Label(action_frame, textvariable=self.batch_status_var).pack(fill=tk.X)
+        self.btn_cancel = ttk.Button(action_frame, text="Cancel", command=self.cancel_batch, state='disabled')
+        self.btn_cancel.pack(fill=tk.X, pady=2)
 
         self.toggle_quality_visibility()
+        self.toggle_merge_state()
         self.toggle_percent_ui()
         self.on_rename_option_change(None)
 
     # --------------------------------------Responsive Canvas Logic --------------------------------------
 
     def on_canvas_resize(self, event):
-        """Called when canvas is resized. Redraws image to fit new size."""
-        if self.cached_preview_img:
-            self.draw_preview_image()
-
-    def draw_preview_image(self):
-        """Draws the cached image onto the canvas, fitting it."""
-        if not self.cached_preview_img:
+        """Called when canvas is resized. Redraws fast now and in full quality once resizing stops."""
+        if self.preview_levels:
+            if self.hq_redraw_job:
+                self.root.after_cancel(self.hq_redraw_job)
+            self.draw_preview_image(fast=True)
+            self.hq_redraw_job = self.root.after(HQ_REDRAW_DELAY_MS, self.finish_canvas_resize)
+
+    def finish_canvas_resize(self):
+        self.hq_redraw_job = None
+        self.draw_preview_image()
+
+    def draw_preview_image(self, fast=False):
+        """Draws the cached pyramid onto the canvas, resampling from the nearest level that fits."""
+        if not self.preview_levels:
             return
 
         canvas_w = self.preview_canvas.winfo_width()
@@ -318,8 +407,11 @@ class SandyResizerApp:
 
         if canvas_w < 10 or canvas_h < 10: return
 
-        preview_img = self.cached_preview_img.copy()
-        preview_img.thumbnail((canvas_w, canvas_h), Image.Resampling.LANCZOS)
+        size = fit_size(self.preview_levels[0].size, (canvas_w, canvas_h))
+        preview_img = pick_level(self.preview_levels, size)
+        if preview_img.size != size:
+            resample = Image.Resampling.BILINEAR if fast else RESAMPLE_PROFILES[self.resample_var.get()]['filter']
+            preview_img = preview_img.resize(size, resample)
 
         self.tk_img = ImageTk.PhotoImage(preview_img)
         self.preview_canvas.delete("all")
@@ -328,7 +420,7 @@ class SandyResizerApp:
     # !-------------------------------------- Filename Logic --------------------------------------
 
     def on_rename_option_change(self, event):
-        if self.rename_var.get() == "Add Suffix":
+        if self.rename_var.get() == RENAME_SUFFIX:
             self.suffix_label.grid(row=1, column=0, sticky='w', padx=5, pady=(5, 0))
             self.suffix_entry.grid(row=1, column=1, sticky='ew', padx=5, pady=(5, 0))
         else:
@@ -336,14 +428,8 @@ class SandyResizerApp:
             self.suffix_entry.grid_forget()
 
     def get_output_filename(self, base_name, w, h):
-        choice = self.rename_var.get()
-        if choice == "[Original Name]_[Width]×[Height]":
-            return f"{base_name}_{w}x{h}"
-        elif choice == "Add Suffix":
-            suffix = self.suffix_var.get()
-            return f"{base_name}_{suffix}"
-        else:
-            return base_name
+        return build_output_name(base_name, w, h,
+                                 {'rename_option': self.rename_var.get(), 'suffix': self.suffix_var.get()})
 
     # !-------------------------------------- Core Resize Logic Helpers --------------------------------------
 
@@ -353,7 +439,19 @@ class SandyResizerApp:
         except ValueError:
             dpi_val = 96.0
 
-        return {
+        try:
+            workers = max(1, int(self.workers_var.get()))
+        except ValueError:
+            workers = 1
+
+        try:
+            max_kb = max(0.0, float(self.max_kb_var.get()))
+        except ValueError:
+            max_kb = 0.0
+
+        # On top of the engine defaults, so the GUI and the CLI hand run_batch the same keys
+        settings = default_settings()
+        settings.update({
             'width': self.width_var.get(),
             'height': self.height_var.get(),
             'unit': self.unit_var.get(),
@@ -363,98 +461,31 @@ class SandyResizerApp:
             'quality': self.quality_var.get(),
             'rename_option': self.rename_var.get(),
             'suffix': self.suffix_var.get(),
-            'dpi': dpi_val
-        }
-
-    def calculate_target_dimensions(self, img, settings):
-        try:
-            orig_w, orig_h = img.size
-            unit = settings['unit']
-
-            try:
-                target_w = float(settings['width'])
-            except:
-                target_w = 0
-
-            try:
-                target_h = float(settings['height'])
-            except:
-                target_h = 0
-
-            if unit == "percent":
-                scale = (target_w if target_w > 0 else 100) / 100.0
-                new_w = int(orig_w * scale)
-                new_h = int(orig_h * scale)
-
-            elif unit in ["inch", "cm", "mm"]:
-                val_w, val_h = target_w, target_h
-                dpi = settings['dpi']
-
-                # -----------------------------------Safety check for DPI-----------------------------------
-                if dpi <= 0: dpi = 96.0
-
-                if unit == "cm":
-                    val_w /= 2.54;
-                    val_h /= 2.54
-                elif unit == "mm":
-                    val_w /= 25.4;
-                    val_h /= 25.4
-
-                new_w = int(val_w * dpi) if target_w > 0 else 0
-                new_h = int(val_h * dpi) if target_h > 0 else 0
-
-                if settings['keep_ratio']:
-                    if target_w > 0 and target_h <= 0:
-                        new_h = int(new_w * (orig_h / orig_w))
-                    elif target_h > 0 and target_w <= 0:
-                        new_w = int(new_h * (orig_w / orig_h))
-
-            else:
-                # -----------------------------------Pixels-----------------------------------
-                new_w = int(target_w) if target_w > 0 else orig_w
-                new_h = int(target_h) if target_h > 0 else orig_h
-
-                if settings['keep_ratio']:
-                    if target_w > 0 and target_h <= 0:
-                        new_h = int(new_w * (orig_h / orig_w))
-                    elif target_h > 0 and target_w <= 0:
-                        new_w = int(new_h * (orig_w / orig_h))
-
-            # !-----------------------------------Safety check for extremely large dimensions
-            MAX_DIM = 20000
-            if new_w > MAX_DIM: new_w = MAX_DIM
-            if new_h > MAX_DIM: new_h = MAX_DIM
-
-            if new_w <= 0: new_w = orig_w
-            if new_h <= 0: new_h = orig_h
-
-            return max(1, new_w), max(1, new_h)
-        except Exception as e:
-            print(f"Dimension Error: {e}")
-            return img.size
+            'dpi': dpi_val,
+            'max_kb': max_kb,
+            'resample': self.resample_var.get(),
+            'workers': workers,
+            'merge': self.merge_var.get()
+        })
+        return settings
 
     # -------------------------------------- Action Methods --------------------------------------
 
     def resize_single(self):
-        if not self.image_list:
+        if not self.files:
             messagebox.showwarning("No Selection", "Please select a photo to resize.")
             return
 
-        path = self.image_list[self.current_preview_index]
+        path = self.files[self.current_preview_index]
+
+        settings = self.get_current_settings()
 
         try:
-            img = Image.open(path)
+            w, h = probe_target(path, settings)
         except Exception as e:
             messagebox.showerror("Error", f"Could not open image: {e}")
             return
 
-        settings = self.get_current_settings()
-
-        angle = int(settings['rotate'])
-        if angle != 0: img = img.rotate(-angle, expand=True)
-
-        w, h = self.calculate_target_dimensions(img, settings)
-
         base_name = os.path.splitext(os.path.basename(path))[0]
         final_name = self.get_output_filename(base_name, w, h)
 
@@ -473,124 +504,147 @@ class SandyResizerApp:
 
         if not save_path: return
 
-        threading.Thread(target=self._process_single, args=(path, save_path, settings, w, h), daemon=True).start()
-
-    def _process_single(self, input_path, output_path, settings, w, h):
+        threading.Thread(target=self._process_single, args=(path, save_path, settings), daemon=True).start()
+
+    def measured_resize(self, path, settings, output_path=None):
+        """resize(), then a write to output_path if given. With METRICS_PATH set, the stage timings of
+        this one file are exported there, replacing the previous report."""
+        if not METRICS_PATH:
+            result = resize(path, settings)
+            if output_path is not None and result['error'] is None:
+                with open(output_path, 'wb') as f:
+                    f.write(result['data'])
+            return result
+
+        metrics = StageMetrics()
+        with recording() as timings:
+            result = resize(path, settings)
+            if output_path is not None and result['error'] is None:
+                with stage("write"):
+                    with open(output_path, 'wb') as f:
+                        f.write(result['data'])
+        metrics.add(path, result['page'], timings, input_size(path), len(result['data'] or b""))
+        metrics.export(METRICS_PATH)
+        print(metrics.format_summary())
+        return result
+
+    def _process_single(self, input_path, output_path, settings):
         try:
-            img = Image.open(input_path)
-
-            angle = int(settings['rotate'])
-            if angle != 0: img = img.rotate(-angle, expand=True)
-
-            img = img.resize((w, h), Image.Resampling.LANCZOS)
-
-            save_args = {}
-            fmt = settings['format']
-
-            # Determine DPI based on unit-----------------------------------
-            # -----------------------------------Force 96 DPI for PX and Percent, otherwise use settings
-            if settings['unit'] in ['px', 'percent']:
-                dpi = 96.0
-            else:
-                dpi = settings['dpi']
-
-            if fmt == "JPEG" and img.mode in ("RGBA", "P"): img = img.convert("RGB")
-
-            # -----------------------------------DPI Handling for standard formats-----------------------------------
-            if fmt in ["JPEG", "PNG", "BMP", "WEBP"]:
-                save_args['dpi'] = (dpi, dpi)
-
-            if fmt in ["JPEG", "WEBP"]:
-                save_args['quality'] = settings['quality']
-            if fmt == "PNG":
-                save_args['compress_level'] = int(9 - (settings['quality'] / 100) * 9)
-
-            if fmt == "PDF":
-                if img.mode in ("RGBA", "P"): img = img.convert("RGB")
-                # ------------------------------Use user-defined DPI for PDF resolution-----------------------------
-                img.save(output_path, "PDF", resolution=dpi)
-            else:
-                img.save(output_path, **save_args)
+            # resize() also covers max_kb, PDF pages and animated GIF/WebP
+            result = self.measured_resize(input_path, settings, output_path)
+            if result['error'] is not None:
+                raise Exception(result['error'])
 
             self.root.after(0, lambda: messagebox.showinfo("Done", f"Image saved to:\n{output_path}"))
         except Exception as e:
             self.root.after(0, lambda: messagebox.showerror("Error", f"Could not save image:\n{e}"))
 
     def start_resize_thread(self):
-        if not self.image_list:
+        if not self.files:
             messagebox.showwarning("No Files", "Please add files to resize.")
             return
 
-        output_dir = filedialog.askdirectory(title="Select Output Folder")
-        if not output_dir: return
-
         settings = self.get_current_settings()
-        threading.Thread(target=self.resize_all, args=(output_dir, settings), daemon=True).start()
-
-    def resize_all(self, output_dir, settings):
-        success_count, errors = 0, 0
-        fmt_choice = settings['format']
-
-        # -----------------------------------Determine DPI based on unit-----------------------------------
-        if settings['unit'] in ['px', 'percent']:
-            dpi = 96.0
+        ext = ARCHIVE_TARGETS.get(self.target_var.get())
+        if ext and not is_merge(settings):
+            # An existing archive is never replaced, so there is nothing to confirm
+            output_dir = filedialog.asksaveasfilename(title="Save Archive As", initialfile=f"resized{ext}",
+                                                      defaultextension=ext, confirmoverwrite=False,
+                                                      filetypes=[(self.target_var.get(), f"*{ext}")])
+            if output_dir and not is_archive(output_dir):
+                output_dir += ext
+            if output_dir:
+                output_dir = free_archive_path(output_dir)
         else:
-            dpi = settings['dpi']
-
-        for path in self.image_list:
-            try:
-                if path.lower().endswith('.pdf'):
-                    errors += 1
-                    continue
-
-                img = Image.open(path)
-
-                angle = int(settings['rotate'])
-                if angle != 0: img = img.rotate(-angle, expand=True)
-
-                w, h = self.calculate_target_dimensions(img, settings)
-                img = img.resize((w, h), Image.Resampling.LANCZOS)
-
-                base_name = os.path.splitext(os.path.basename(path))[0]
-                final_name = self.get_output_filename(base_name, w, h)
-
-                ext = f".{fmt_choice.lower()}"
-                if ext == ".jpeg": ext = ".jpg"
-
-                out_path = os.path.join(output_dir, f"{final_name}{ext}")
-
-                counter = 1
-                while os.path.exists(out_path):
-                    out_path = os.path.join(output_dir, f"{final_name}_{counter}{ext}")
-                    counter += 1
-
-                save_args = {}
-                if fmt_choice in ["JPEG", "JPG"]:
-                    if img.mode in ("RGBA", "P"): img = img.convert("RGB")
-                    save_args['quality'] = settings['quality']
+            output_dir = filedialog.askdirectory(title="Select Output Folder")
+        if not output_dir: return
 
-                # -----------------------------------Apply DPI to standard formats-----------------------------------
-                if fmt_choice in ["JPEG", "JPG", "PNG", "BMP", "WEBP"]:
-                    save_args['dpi'] = (dpi, dpi)
+        if self.batch_outputs and not is_merge(settings):
+            settings['outputs'] = list(self.batch_outputs)
+
+        # Copied here on the Tk thread: the loader may still be adding rows while the batch runs
+        files = list(self.files)
+        self.batch_cancel = threading.Event()
+        self.btn_resize_all.config(state='disabled')
+        self.btn_cancel.config(state='normal')
+        self.batch_progress['value'] = 0
+        self.batch_status_var.set("Starting...")
+        threading.Thread(target=self.resize_all, args=(files, output_dir, settings, self.batch_cancel),
+                         daemon=True).start()
+        self.root.after(100, self.process_progress_queue)
+
+    def cancel_batch(self):
+        if self.batch_cancel is not None:
+            self.batch_cancel.set()
+            self.btn_cancel.config(state='disabled')
+            self.batch_status_var.set("Cancelling after the files in progress...")
+
+    def add_batch_output(self):
+        self.batch_outputs.append(output_spec(self.get_current_settings()))
+        self.outputs_var.set(f"Outputs: {len(self.batch_outputs)} queued")
+
+    def clear_batch_outputs(self):
+        self.batch_outputs = []
+        self.outputs_var.set("Outputs: current settings")
+
+    def resize_all(self, files, output_dir, settings, cancel):
+        def progress(state):
+            self.progress_queue.put(('progress', state.done, state.total, state.rate(), state.eta(),
+                                     len(state.failures)))
 
-                if fmt_choice == "WEBP":
-                    save_args['quality'] = settings['quality']
-                if fmt_choice == "PNG":
-                    save_args['compress_level'] = int(9 - (settings['quality'] / 100) * 9)
+        try:
+            if is_merge(settings):
+                success_count, errors = run_merged(files, settings, output_dir, settings['workers'],
+                                                   progress, cancel)
+            else:
+                metrics = StageMetrics() if METRICS_PATH else None
+                success_count, errors = run_batch(files, settings, output_dir, settings['workers'],
+                                                  progress=progress, cancel=cancel, metrics=metrics)
+                if metrics is not None:
+                    metrics.export(METRICS_PATH)
+                    print(metrics.format_summary())
+        except Exception as e:
+            success_count, errors = 0, [(output_dir, str(e))]
+        self.progress_queue.put(('finished', success_count, errors, cancel.is_set(), output_dir))
 
-                if fmt_choice == "PDF":
-                    if img.mode in ("RGBA", "P"): img = img.convert("RGB")
-                    img.save(out_path, "PDF", resolution=dpi)
+    def process_progress_queue(self):
+        try:
+            while True:
+                item = self.progress_queue.get_nowait()
+                if item[0] == 'progress':
+                    _, done, total, rate, eta, failed = item
+                    self.batch_progress['maximum'] = max(1, total)
+                    self.batch_progress['value'] = done
+                    status = f"{done}/{total} files, {rate:.1f}/s"
+                    if eta is not None and done < total:
+                        status += f", {format_duration(eta)} left"
+                    if failed:
+                        status += f", {failed} failed"
+                    if not self.batch_cancel.is_set():
+                        self.batch_status_var.set(status)
                 else:
-                    img.save(out_path, **save_args)
-
-                success_count += 1
-            except Exception as e:
-                print(f"Error processing {path}: {e}")
-                errors += 1
-
-        msg = f"Completed!\nSuccess: {success_count}\nErrors/Skipped: {errors}"
-        self.root.after(0, lambda: messagebox.showinfo("Done", msg))
+                    self.finish_batch(*item[1:])
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(100, self.process_progress_queue)
+
+    def finish_batch(self, success_count, errors, cancelled, output_dir):
+        self.batch_cancel = None
+        self.btn_resize_all.config(state='normal')
+        self.btn_cancel.config(state='disabled')
+        self.batch_status_var.set("Cancelled" if cancelled else "")
+        for path, error in errors:
+            print(f"Error processing {path}: {error}")
+
+        msg = f"{'Cancelled' if cancelled else 'Completed'}!\nSuccess: {success_count}\nErrors/Skipped: {len(errors)}"
+        if is_archive(output_dir) and success_count:
+            msg += f"\nSaved to: {os.path.basename(output_dir)}"
+        if errors:
+            msg += "\n\n" + "\n".join(f"{os.path.basename(path)}: {error}" for path, error in errors[:10])
+            if len(errors) > 10:
+                msg += f"\n... and {len(errors) - 10} more"
+        messagebox.showinfo("Cancelled" if cancelled else "Done", msg)
 
     # -------------------------------------- Loading Logic --------------------------------------
 
@@ -606,51 +660,137 @@ class SandyResizerApp:
             self.btn_add_folder.config(state='normal')
             self.status_var.set("")
 
-    def threaded_load_files(self, files):
-        for f in files:
-            ext = os.path.splitext(f)[1].lower()
-            if ext in SUPPORTED_FORMATS:
-                pil_thumb = None
-                if not f.lower().endswith('.pdf'):
-                    try:
-                        img = Image.open(f)
-                        img.thumbnail((32, 32), Image.Resampling.LANCZOS)
-                        pil_thumb = img
-                    except:
-                        pass
-                self.loading_queue.put((f, os.path.basename(f), pil_thumb))
+    def threaded_load_files(self, paths):
+        # Folders are walked recursively; only headers are read here, thumbnails come later
+        chunk = []
+        for f in iter_image_files(paths):
+            chunk.append(f)
+            if len(chunk) >= LOAD_CHUNK:
+                self._load_chunk(chunk)
+                chunk = []
+        self._load_chunk(chunk)
         self.loading_queue.put(None)
 
+    def _load_chunk(self, files):
+        known = self.thumb_cache.get_headers(files) if self.thumb_cache else {}
+        probed = {}
+        for f in files:
+            info = known.get(f)
+            if info is None:
+                info = probed[f] = probe_header(f)
+            self.loading_queue.put((f, os.path.basename(f), info))
+        if self.thumb_cache and probed:
+            self.thumb_cache.put_headers(probed)
+
     def process_loading_queue(self):
+        """Takes loaded files into the list for at most INGEST_BUDGET_MS, then yields to the Tk loop."""
         if not self.is_loading: return
+        deadline = time.perf_counter() + INGEST_BUDGET_MS / 1000
+        finished = False
+        while not finished and time.perf_counter() < deadline:
+            batch = {}
+            try:
+                while len(batch) < INGEST_BATCH:
+                    item = self.loading_queue.get_nowait()
+                    if item is None:
+                        finished = True
+                        break
+                    f, name, info = item
+                    if f not in self.files:
+                        batch[f] = (name, info)
+            except queue.Empty:
+                pass
+            if not batch:
+                break
+            self.insert_file_rows(batch)
+
+        self.status_var.set(f"Loaded {len(self.files)} files...")
+        self.schedule_thumbnails()
+        if finished:
+            self.set_ui_loading(False)
+        else:
+            # Straight back if files are waiting, otherwise poll
+            self.root.after(1 if not self.loading_queue.empty() else 100, self.process_loading_queue)
+
+    def insert_file_rows(self, batch):
+        """Adds {path: (name, header info)} to the model and the Treeview."""
+        names = tuple(name for name, _ in batch.values())
+        iids = self.root.tk.splitlist(self.root.tk.call('apply', TREE_INSERT_SCRIPT, str(self.file_tree), names))
+        for (f, (_, info)), iid in zip(batch.items(), iids):
+            self.files.add(f, iid, info)
+
+    # -------------------------------------- Lazy Thumbnails --------------------------------------
+
+    def on_tree_scroll(self, first, last):
+        self.tree_scrollbar.set(first, last)
+        self.schedule_thumbnails()
+
+    def schedule_thumbnails(self):
+        if self.thumb_job is None:
+            self.thumb_job = self.root.after(THUMB_DELAY_MS, self.request_visible_thumbnails)
+
+    def request_visible_thumbnails(self):
+        self.thumb_job = None
+        count = len(self.files)
+        if not count:
+            return
+        first, last = self.file_tree.yview()
+        start = max(0, int(first * count) - THUMB_MARGIN_ROWS)
+        end = min(count, math.ceil(last * count) + THUMB_MARGIN_ROWS)
+        was_idle = not self.thumb_pending
+        wanted = [path for path, thumb in zip(self.files.paths[start:end], self.files.thumbnails[start:end])
+                  if thumb is None and path not in self.thumb_pending]
+        if not wanted:
+            return
+        self.thumb_pending.update(wanted)
+        step = math.ceil(len(wanted) / THUMB_WORKERS)
+        for i in range(0, len(wanted), step):
+            self.thumb_pool.submit(self.load_thumbnails, wanted[i:i + step], self.resample_var.get())
+        if was_idle:
+            self.root.after(THUMB_DELAY_MS, self.process_thumbnail_queue)
+
+    def load_thumbnails(self, paths, resample):
+        """Thumbnail pool task: cached thumbnails in one read, the rest decoded and cached."""
+        cached = self.thumb_cache.get_thumbnails(paths, resample) if self.thumb_cache else {}
+        made = {}
+        for path in paths:
+            thumb = cached.get(path)
+            if thumb is None:
+                thumb = made[path] = load_thumbnail(path, resample)
+            self.thumb_queue.put((path, thumb))
+        if self.thumb_cache and made:
+            self.thumb_cache.put_thumbnails(made, resample)
+
+    def process_thumbnail_queue(self):
+        deadline = time.perf_counter() + INGEST_BUDGET_MS / 1000
         try:
             while True:
-                item = self.loading_queue.get_nowait()
-                if item is None:
-                    self.set_ui_loading(False)
+                if time.perf_counter() >= deadline:
+                    self.root.after(1, self.process_thumbnail_queue)
                     return
-                else:
-                    f, name, pil_thumb = item
-                    if f not in self.image_list:
-                        self.image_list.append(f)
-                        thumb_photo = None
-                        if pil_thumb:
-                            thumb_photo = ImageTk.PhotoImage(pil_thumb)
-                            self.thumbnails.append(thumb_photo)
-                        else:
-                            self.thumbnails.append(None)
-
-                        if thumb_photo:
-                            self.file_tree.insert('', 'end', text=name, image=thumb_photo)
-                        else:
-                            self.file_tree.insert('', 'end', text=name)
-                        self.status_var.set(f"Loaded {len(self.image_list)} files...")
+                path, pil_thumb = self.thumb_queue.get_nowait()
+                self.thumb_pending.discard(path)
+                idx = self.files.index(path)
+                if idx is None:
+                    continue  # removed while its thumbnail was being made
+                if pil_thumb is None:
+                    self.files.thumbnails[idx] = False
+                    continue
+                photo = ImageTk.PhotoImage(pil_thumb)
+                self.files.thumbnails[idx] = photo
+                self.file_tree.item(self.files.iids[idx], image=photo)
         except queue.Empty:
-            if self.is_loading:
-                self.root.after(100, self.process_loading_queue)
+            if self.thumb_pending:
+                self.root.after(THUMB_DELAY_MS, self.process_thumbnail_queue)
 
     # ----------------------------------- UI Logic Methods -----------------------------------------
 
+    def on_close(self):
+        self.thumb_pool.shutdown(wait=False, cancel_futures=True)
+        if self.thumb_cache:
+            self.thumb_cache.close()
+        self.root.destroy()
+
     def add_files(self):
         files = filedialog.askopenfilenames(
             filetypes=[("Image Files", "*.bmp *.jpg *.jpeg *.gif *.png *.pdf *.webp *.ico")])
@@ -661,13 +801,8 @@ class SandyResizerApp:
     def add_folder(self):
         folder = filedialog.askdirectory()
         if folder:
-            files = []
-            for ext in SUPPORTED_FORMATS:
-                files.extend(glob.glob(os.path.join(folder, f"*{ext}")))
-                files.extend(glob.glob(os.path.join(folder, f"*{ext.upper()}")))
-            if files:
-                self.set_ui_loading(True)
-                threading.Thread(target=self.threaded_load_files, args=(files,), daemon=True).start()
+            self.set_ui_loading(True)
+            threading.Thread(target=self.threaded_load_files, args=([folder],), daemon=True).start()
 
     def on_drop(self, event):
         files = self.root.tk.splitlist(event.data)
@@ -739,24 +874,30 @@ class SandyResizerApp:
     def on_format_change(self, event):
         self.update_preset_list()
         self.toggle_quality_visibility()
+        self.toggle_merge_state()
         self.update_preview()
 
     def update_preset_list(self):
         fmt = self.format_var.get()
+        presets = presets_for_format(fmt)
         if fmt == "PDF":
-            presets = PRESETS_PDF
             self.unit_var.set("mm")
         elif fmt == "ICO":
-            presets = PRESETS_ICO
             self.unit_var.set("px")
         else:
-            presets = PRESETS_GENERAL
             self.unit_var.set("percent")
 
         self.preset_combo['values'] = list(presets.keys())
         self.preset_var.set("Custom")
         self.toggle_percent_ui()
 
+    def toggle_merge_state(self):
+        if self.format_var.get() in MERGE_FORMATS:
+            self.merge_check.state(['!disabled'])
+        else:
+            self.merge_var.set(False)
+            self.merge_check.state(['disabled'])
+
     def toggle_quality_visibility(self):
         selected_format = self.format_var.get()
         self.quality_frame.pack_forget()
@@ -769,39 +910,28 @@ class SandyResizerApp:
 
     def remove_selected(self):
         selected_items = self.file_tree.selection()
-        children = self.file_tree.get_children('')
-        indices_to_remove = []
-
-        for item in selected_items:
-            try:
-                idx = children.index(item)
-                indices_to_remove.append(idx)
-            except ValueError:
-                pass
-
-        for idx in sorted(indices_to_remove, reverse=True):
-            self.image_list.pop(idx)
-            self.thumbnails.pop(idx)
-
-        for item in selected_items:
-            self.file_tree.delete(item)
+        if not selected_items:
+            return
+        self.files.remove_iids(selected_items)
+        self.file_tree.delete(*selected_items)
+        self.current_preview_index = min(self.current_preview_index, max(0, len(self.files) - 1))
 
-        if not self.image_list:
-            self.cached_preview_img = None
+        if not self.files:
+            self.preview_levels = None
             self.preview_canvas.delete("all")
             self.preview_info_var.set("No images loaded")
             self.calculated_size_var.set("Size: --")
         else:
-            self.cached_preview_img = None
+            self.preview_levels = None
             self.preview_canvas.delete("all")
             self.preview_info_var.set("Select an image")
 
     def remove_all(self):
-        self.image_list = []
-        self.thumbnails = []
-        self.cached_preview_img = None
-        for item in self.file_tree.get_children():
-            self.file_tree.delete(item)
+        self.files.clear()
+        self.thumb_pending.clear()
+        self.preview_levels = None
+        self.preview_cache.clear()
+        self.file_tree.delete(*self.file_tree.get_children())
 
         self.preview_canvas.delete("all")
         self.preview_info_var.set("No images loaded")
@@ -811,24 +941,15 @@ class SandyResizerApp:
     def on_tree_select(self, event):
         selection = self.file_tree.selection()
         if selection:
-            children = self.file_tree.get_children('')
-            try:
-                idx = children.index(selection[0])
+            idx = self.files.index_of_iid(selection[0])
+            if idx is not None:
                 self.current_preview_index = idx
                 self.preview_running = False
                 self.update_preview(update_ratio=True)
-            except ValueError:
-                pass
 
     def on_preset_change(self, event):
         selected = self.preset_var.get()
-        fmt = self.format_var.get()
-        if fmt == "PDF":
-            presets = PRESETS_PDF
-        elif fmt == "ICO":
-            presets = PRESETS_ICO
-        else:
-            presets = PRESETS_GENERAL
+        presets = presets_for_format(self.format_var.get())
 
         if selected != "Custom":
             w, h = presets[selected]
@@ -873,87 +994,72 @@ class SandyResizerApp:
         self.update_preview()
 
     def update_preview(self, update_ratio=False):
-        if not self.image_list: return
+        if not self.files: return
         try:
-            path = self.image_list[self.current_preview_index]
-            if path.lower().endswith('.pdf'):
+            path = self.files[self.current_preview_index]
+            if is_pdf(path) and not PDF_SUPPORT:
                 self.preview_canvas.delete("all")
                 self.preview_canvas.create_text(self.preview_canvas.winfo_width() // 2,
                                                 self.preview_canvas.winfo_height() // 2,
-                                                text="PDF File\n(Preview not available)", fill="white",
+                                                text="PDF File\n(Preview needs PyMuPDF)", fill="white",
                                                 justify='center')
                 self.preview_info_var.set(f"File: {os.path.basename(path)} (PDF)")
-                self.cached_preview_img = None
+                self.preview_levels = None
                 return
 
-            img = Image.open(path)
+            angle = int(self.rotate_var.get())
+            # Sizes come from the header; the cached pixels only need to cover the screen
+            levels, orig_size = self.preview_cache.get(path, angle, self.resample_var.get())
 
             if update_ratio:
-                self.current_orig_w, self.current_orig_h = img.size
+                self.current_orig_w, self.current_orig_h = orig_size
                 if self.current_orig_w > 0: self.orig_img_ratio = self.current_orig_h / self.current_orig_w
 
-            angle = int(self.rotate_var.get())
-            if angle != 0:
-                img = img.rotate(-angle, expand=True)
-                if update_ratio: self.orig_img_ratio = img.size[1] / img.size[0]
+            full_w, full_h = rotated_size(orig_size, angle)
+            if angle != 0 and update_ratio: self.orig_img_ratio = full_h / full_w
 
-            self.cached_preview_img = img
+            self.preview_levels = levels
 
             settings = self.get_current_settings()
-            w, h = self.calculate_target_dimensions(img, settings)
+            w, h = compute_target_dimensions((full_w, full_h), settings)
 
             self.draw_preview_image()
 
             self.preview_info_var.set(f"File: {os.path.basename(path)}\nNew Size: {w} x {h} px")
+
+            # Warm the cache with the image the slideshow will show next
+            if update_ratio:
+                next_path = self.files[(self.current_preview_index + 1) % len(self.files)]
+                if not is_pdf(next_path) or PDF_SUPPORT:
+                    self.preview_cache.prefetch(next_path, angle, self.resample_var.get())
         except Exception:
             pass
 
     def start_preview_loop(self):
-        if self.preview_running and self.image_list:
-            children = self.file_tree.get_children()
-            if children:
-                next_idx = (self.current_preview_index + 1) % len(self.image_list)
-                self.current_preview_index = next_idx
-                self.file_tree.selection_set(children[next_idx])
-                self.file_tree.see(children[next_idx])
-                self.update_preview(update_ratio=True)
+        if self.preview_running and self.files:
+            next_idx = (self.current_preview_index + 1) % len(self.files)
+            self.current_preview_index = next_idx
+            self.file_tree.selection_set(self.files.iids[next_idx])
+            self.file_tree.see(self.files.iids[next_idx])
+            self.update_preview(update_ratio=True)
         self.root.after(2000, self.start_preview_loop)
 
     def calculate_buffer_size(self):
-        if not self.image_list:
+        if not self.files:
             messagebox.showwarning("No Files", "Please add files first.")
             return
         try:
-            path = self.image_list[self.current_preview_index]
-            if path.lower().endswith('.pdf'):
+            path = self.files[self.current_preview_index]
+            if is_pdf(path) and not PDF_SUPPORT:
                 self.calculated_size_var.set("Size: PDF (N/A)")
                 return
-            img = Image.open(path)
-            angle = int(self.rotate_var.get())
-            if angle != 0: img = img.rotate(-angle, expand=True)
-
             settings = self.get_current_settings()
-            w, h = self.calculate_target_dimensions(img, settings)
-
-            img = img.resize((w, h), Image.Resampling.LANCZOS)
-            save_fmt = self.format_var.get()
-            if save_fmt == "JPEG" and img.mode in ("RGBA", "P"): img = img.convert("RGB")
-            buffer = io.BytesIO()
-            quality = self.quality_var.get()
-            params = {}
-            if save_fmt in ["JPEG", "WEBP"]:
-                params['quality'] = quality
-            elif save_fmt == "PNG":
-                params['compress_level'] = int(9 - (quality / 100) * 9)
-            img.save(buffer, format=save_fmt, **params)
-            size_bytes = buffer.tell()
-            if size_bytes < 1024:
-                size_str = f"{size_bytes} Bytes"
-            elif size_bytes < 1024 * 1024:
-                size_str = f"{size_bytes / 1024:.2f} KB"
-            else:
-                size_str = f"{size_bytes / (1024 * 1024):.2f} MB"
-            self.calculated_size_var.set(f"Size: {size_str} ({save_fmt})")
+            result = self.measured_resize(path, settings)
+            if result['error'] is not None:
+                raise Exception(result['error'])
+
+            size_str = format_size(len(result['data']))
+            self.calculated_size_var.set(f"Size: {size_str} ({settings['format']})")
         except Exception as e:
             print(f"Error calculating size: {e}")
             self.calculated_size_var.set("Error calculating size")
@@ -961,6 +1067,7 @@ class SandyResizerApp:
     def load_ui_settings(self):
         self.update_preset_list()
         self.toggle_quality_visibility()
+        self.toggle_merge_state()
         self.toggle_percent_ui()
         self.on_rename_option_change(None)
 
@@ -0,0 +1,173 @@
+"""Merged output: a whole batch written as one multi-page PDF or one animated GIF/WebP.
+
+Pages are resized in worker processes (a bounded window ahead of the writer) and handed to
+Pillow's save_all through PageSequence, a multi-frame image that pulls the next page from a
+generator on seek(). The PDF and WebP writers walk frames with seek(), so only the current page
+(plus the first, which carries the save call) is held decoded. Pillow's GIF writer keeps its own
+per-frame deltas until the file is finished.
+"""
+from PIL import Image
+import os
+from collections import deque
+from engine import (BatchProgress, expand_tasks, output_dpi, output_extension, prepare_for_format, probe_target,
+                    resize_source, worker_pool)
+from output_writer import PART_SUFFIX, OutputNames
+
+MERGE_FORMATS = ["PDF", "GIF", "WEBP"]
+MERGE_NAME = "merged"
+# Pages resized ahead of the writer, per worker
+PAGES_AHEAD = 2
+
+
+class MergeCancelled(Exception):
+    pass
+
+
+class PageSequence(Image.Image):
+    """Multi-frame image over an iterator of count pages. Forward-only: seek(n) loads page n."""
+
+    def __init__(self, pages, count):
+        super().__init__()
+        self._pages = iter(pages)
+        self.n_frames = count
+        self.is_animated = count > 1
+        self._frame = -1
+        self.seek(0)
+
+    def seek(self, frame):
+        if frame == self._frame:
+            return
+        if frame != self._frame + 1 or frame >= self.n_frames:
+            raise EOFError("PageSequence only seeks forward one page at a time")
+        try:
+            page = next(self._pages)
+        except StopIteration:
+            raise EOFError("ran out of pages") from None
+        page.load()
+        self._frame = frame
+        self.im = page.im
+        self._mode = page.mode
+        self._size = page.size
+        self.info = page.info.copy()
+        self.palette = page.palette.copy() if page.palette else None
+
+    def tell(self):
+        return self._frame
+
+
+def is_merge(settings):
+    return bool(settings.get('merge')) and settings['format'] in MERGE_FORMATS
+
+
+def resize_page(task, settings, canvas=None):
+    """Worker task: one page resized to its target, or fitted and centred on canvas (w, h) for animations."""
+    path, page = task
+    if canvas is None:
+        img, _ = resize_source(path, settings, page)
+        return prepare_for_format(img, settings['format'])
+
+    # Frames of an animation share one canvas: fit inside it with a single resample, then pad
+    w, h = probe_target(path, settings, page)
+    scale = min(canvas[0] / w, canvas[1] / h)
+    fit = dict(settings, unit='px', keep_ratio=False,
+               width=str(max(1, round(w * scale))), height=str(max(1, round(h * scale))))
+    img, (w, h) = resize_source(path, fit, page)
+    frame = Image.new("RGBA", canvas, (0, 0, 0, 0))
+    frame.paste(img.convert("RGBA"), ((canvas[0] - w) // 2, (canvas[1] - h) // 2))
+    return frame
+
+
+def iter_pages(tasks, settings, workers, canvas=None):
+    """Yields resized pages in task order, keeping at most PAGES_AHEAD x workers in flight."""
+    workers = max(1, min(workers, len(tasks)))
+    if workers == 1:
+        for task in tasks:
+            yield resize_page(task, settings, canvas)
+        return
+
+    with worker_pool(workers) as pool:
+        window = deque()
+        try:
+            for task in tasks:
+                window.append(pool.submit(resize_page, task, settings, canvas))
+                if len(window) >= workers * PAGES_AHEAD:
+                    yield window.popleft().result()
+            while window:
+                yield window.popleft().result()
+        finally:
+            for future in window:
+                future.cancel()
+
+
+def merge_save_args(settings):
+    fmt = settings['format']
+    if fmt == "PDF":
+        return {'resolution': output_dpi(settings)}
+    args = {'duration': settings.get('frame_ms', 500), 'loop': 0}
+    if fmt == "GIF":
+        args['disposal'] = 2
+    if fmt == "WEBP":
+        args['quality'] = settings['quality']
+    return args
+
+
+def write_merged(pages, count, fp, settings):
+    """Writes count pages from an iterator as one file through save_all/append_images."""
+    pages = iter(pages)
+    first = next(pages)
+    rest = [PageSequence(pages, count - 1)] if count > 1 else []
+    first.save(fp, format=settings['format'], save_all=True, append_images=rest, **merge_save_args(settings))
+
+
+def run_merged(paths, settings, output_dir, workers=None, progress=None, cancel=None):
+    """Resizes paths into a single merged file in output_dir. Returns (success_count, [(path, error), ...]).
+
+    Every image and PDF page becomes one page or frame. Sources whose header cannot be read are
+    skipped and reported; a decode failure after writing has started fails the merged file.
+    progress and cancel work as in engine.run_batch, except that cancelling discards the merged file.
+    """
+    workers = workers or settings.get('workers') or os.cpu_count() or 1
+    tasks, canvas = [], None
+    state = BatchProgress(0)
+    errors = state.failures
+
+    # The PDF and WebP writers need the page count up front, so unreadable sources are dropped first
+    for task in expand_tasks(list(paths)):
+        try:
+            target = probe_target(task[0], settings, task[1])
+        except Exception as e:
+            errors.append((task[0], str(e)))
+            continue
+        if canvas is None and settings['format'] != "PDF":
+            canvas = target
+        tasks.append(task)
+    if not tasks:
+        return 0, errors
+    state.total = len(tasks)
+
+    def tracked(pages):
+        for page in pages:
+            if cancel is not None and cancel.is_set():
+                raise MergeCancelled()
+            state.done += 1
+            if progress is not None:
+                progress(state)
+            yield page
+
+    out_path = OutputNames(output_dir).reserve(MERGE_NAME, output_extension(settings['format']))
+
+    part = out_path + PART_SUFFIX
+    try:
+        with open(part, 'wb') as f:
+            write_merged(tracked(iter_pages(tasks, settings, workers, canvas)), len(tasks), f, settings)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(part, out_path)
+    except Exception as e:
+        if os.path.exists(part):
+            os.remove(part)
+        if not isinstance(e, MergeCancelled):
+            errors.append((out_path, str(e)))
+        return 0, errors
+
+    return len(tasks), errors
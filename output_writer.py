@@ -0,0 +1,274 @@
+"""Output writers: a folder, with in-memory name reservation and atomic, batch-synced writes, or an archive.
+
+The folder is listed once. After that, names are reserved from an in-memory index instead of
+probing the disk for name, name_1, name_2, ... for every file, so a name handed out is never given
+again even before its file exists. Each output is written to a .part file next to its final path.
+Every SYNC_FILES outputs (or SYNC_SECONDS), the pending files are fsynced together, renamed into
+place and the folder is synced once. A crash therefore never leaves a truncated file under an
+output name; the .part files it leaves are removed when the folder is next written to.
+
+ArchiveWriter streams the same outputs into one ZIP or TAR file instead, with the same interface.
+Like output files, an archive never replaces an existing one: free_archive_path() picks a _N name.
+"""
+import gzip
+import os
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from metrics import stage
+
+PART_SUFFIX = ".part"
+SYNC_FILES = 32
+SYNC_SECONDS = 1.0
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+# Output extensions whose data is compressed already, stored in ZIPs as is
+STORED_EXTENSIONS = (".jpg", ".png", ".webp", ".gif", ".pdf")
+# Every extension an output can have; only .part files of these are swept
+OUTPUT_EXTENSIONS = STORED_EXTENSIONS + (".bmp", ".ico")
+TAR_BLOCK = 512
+# tar pads the end of an archive to a multiple of this, as GNU tar and tarfile do
+TAR_RECORD = 20 * TAR_BLOCK
+
+
+def is_archive(path):
+    """True if path names an archive target (.zip, .tar, .tar.gz or .tgz) rather than a folder."""
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def free_archive_path(path):
+    """path if nothing exists there, else the first free of name_1.zip, name_2.zip, ... (or .tar.gz etc.)."""
+    n = len(next(suffix for suffix in ARCHIVE_SUFFIXES if path.lower().endswith(suffix)))
+    stem, suffix = path[:-n], path[-n:]
+    counter = 0
+    while os.path.exists(path):
+        counter += 1
+        path = f"{stem}_{counter}{suffix}"
+    return path
+
+
+def _name_key(name):
+    # Windows and macOS folders are case-insensitive by default
+    return name.casefold() if sys.platform in ("win32", "darwin") else name
+
+
+class OutputNames:
+    """Free output names in one folder, listed once and then reserved in memory. Thread-safe.
+
+    The listing also removes output .part files an interrupted run left behind. Without a folder,
+    the index starts empty and reserve() returns bare names (archive entries).
+    """
+
+    def __init__(self, output_dir=None):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        try:
+            names = os.listdir(output_dir) if output_dir else []
+        except FileNotFoundError:
+            names = []
+        self._taken = {_name_key(name) for name in names if not self._sweep(name)}
+        # Next _N suffix to try per name, so repeated collisions do not rescan from _1
+        self._next = {}
+
+    def _sweep(self, name):
+        """Removes name if it is a leftover output .part file. True if it was one."""
+        if not (name.endswith(PART_SUFFIX) and name[:-len(PART_SUFFIX)].lower().endswith(OUTPUT_EXTENSIONS)):
+            return False
+        try:
+            os.remove(os.path.join(self.output_dir, name))
+        except OSError:
+            return False
+        return True
+
+    def reserve(self, name, ext):
+        """Reserves the first free of name+ext, name_1+ext, name_2+ext, ... and returns its path."""
+        with self._lock:
+            key = _name_key(name + ext)
+            counter = self._next.get(key, 0)
+            while True:
+                candidate = f"{name}_{counter}{ext}" if counter else f"{name}{ext}"
+                if _name_key(candidate) not in self._taken:
+                    break
+                counter += 1
+            self._taken.add(_name_key(candidate))
+            self._next[key] = counter + 1
+        return os.path.join(self.output_dir, candidate) if self.output_dir else candidate
+
+    def claim(self, path):
+        """Marks a path chosen elsewhere (e.g. claimed by an earlier run) as taken."""
+        with self._lock:
+            self._taken.add(_name_key(os.path.basename(path)))
+
+
+class OutputWriter:
+    """Atomic writes into one folder, with fsyncs batched per flush(). Used from one thread at a time."""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.names = OutputNames(output_dir)
+        # (final path, open .part file) written since the last flush
+        self._pending = []
+        self._oldest = None
+
+    def write(self, path, data):
+        """Writes data to path's .part file. path appears at the next flush(); raises if the write fails."""
+        part = path + PART_SUFFIX
+        f = None
+        try:
+            with stage("write"):
+                f = open(part, 'wb')
+                f.write(data)
+                f.flush()
+        except BaseException:
+            if f is not None:
+                f.close()
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+        if not self._pending:
+            self._oldest = time.monotonic()
+        self._pending.append((path, f))
+
+    def due(self):
+        """True once SYNC_FILES outputs are pending or the oldest has waited SYNC_SECONDS.
+
+        Only checked when the caller asks, so a caller that may go quiet should also ask on a timer.
+        """
+        return bool(self._pending) and (len(self._pending) >= SYNC_FILES or
+                                        time.monotonic() - self._oldest >= SYNC_SECONDS)
+
+    def flush(self):
+        """Syncs and renames every pending output into place, then syncs the folder.
+
+        Returns {path: error message} for outputs that could not be committed; their .part files are removed.
+        """
+        failed = {}
+        with stage("sync"):
+            for path, f in self._pending:
+                part = f.name
+                try:
+                    try:
+                        os.fsync(f.fileno())
+                    finally:
+                        f.close()
+                    os.replace(part, path)
+                except OSError as e:
+                    failed[path] = str(e)
+                    if os.path.exists(part):
+                        os.remove(part)
+            if len(failed) < len(self._pending):
+                self._sync_folder()
+        self._pending = []
+        return failed
+
+    def _sync_folder(self):
+        # Makes the renames durable; folders cannot be opened for fsync on Windows
+        if sys.platform == "win32":
+            return
+        try:
+            fd = os.open(self.output_dir, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def close(self, publish=True):
+        """Nothing to finish: every output is in place once flush() returns. Returns {}, like ArchiveWriter."""
+        return {}
+
+
+class ArchiveWriter:
+    """Streams outputs into one ZIP or TAR file, with OutputWriter's interface; write() takes entry names.
+
+    Each output goes from its encoded buffer straight into the archive as an entry, with no file
+    per output. TAR headers are written as entries arrive, so memory does not grow with the entry
+    count. A ZIP keeps one small record per entry for its central directory. The archive is built
+    in a .part file, then synced and renamed into place by close(). An existing file at path is
+    never replaced: the constructor raises FileExistsError (see free_archive_path).
+    """
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            raise FileExistsError(f"{path} already exists")
+        self.path = path
+        self.names = OutputNames()
+        # Entry names written so far; none of them is committed until close() publishes the archive
+        self._entries = []
+        self._mtime = time.time()
+        self._file = open(path + PART_SUFFIX, 'wb')
+        self._zip = self._stream = None
+        lower = path.lower()
+        if lower.endswith(".zip"):
+            self._zip = zipfile.ZipFile(self._file, 'w', allowZip64=True)
+        elif lower.endswith((".tar.gz", ".tgz")):
+            # Name the header after the final archive, not the .part file being written
+            self._stream = gzip.GzipFile(filename=os.path.basename(path), fileobj=self._file, mode='wb',
+                                         mtime=int(self._mtime))
+        else:
+            self._stream = self._file
+        self._tar_bytes = 0
+
+    def write(self, name, data):
+        self._entries.append(name)
+        with stage("write"):
+            if self._zip is not None:
+                info = zipfile.ZipInfo(name, time.localtime(self._mtime)[:6])
+                info.compress_type = (zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTENSIONS)
+                                      else zipfile.ZIP_DEFLATED)
+                info.external_attr = 0o644 << 16
+                self._zip.writestr(info, data)
+                return
+            info = tarfile.TarInfo(name)
+            info.size, info.mtime, info.mode = len(data), int(self._mtime), 0o644
+            header = info.tobuf(tarfile.PAX_FORMAT)
+            padding = b"\0" * (-len(data) % TAR_BLOCK)
+            self._stream.write(header)
+            self._stream.write(data)
+            self._stream.write(padding)
+            self._tar_bytes += len(header) + len(data) + len(padding)
+
+    def due(self):
+        return False
+
+    def flush(self):
+        """Entries are committed together by close(); nothing fails here."""
+        return {}
+
+    def close(self, publish=True):
+        """Finishes the archive, syncs it and renames it into place; with publish off, deletes it instead.
+
+        Returns {entry name: error message} for every entry when the archive was not published.
+        """
+        part = self.path + PART_SUFFIX
+        try:
+            # Finished either way, so no open stream is left to write into a closed file later
+            with stage("sync"):
+                if self._zip is not None:
+                    self._zip.close()
+                else:
+                    # End-of-archive marker: two zero blocks, padded to a whole record
+                    end = 2 * TAR_BLOCK
+                    end += -(self._tar_bytes + end) % TAR_RECORD
+                    self._stream.write(b"\0" * end)
+                    if self._stream is not self._file:
+                        self._stream.close()
+                if publish:
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                self._file.close()
+            if not publish:
+                raise OSError("the batch stopped before the archive was finished")
+            if os.path.exists(self.path):
+                raise FileExistsError(f"{self.path} already exists")
+            os.replace(part, self.path)
+        except OSError as e:
+            self._file.close()
+            if os.path.exists(part):
+                os.remove(part)
+            return {name: str(e) for name in self._entries}
+        return {}
@@ -0,0 +1,59 @@
+"""PDF input: rasterizes pages one at a time (optional, needs PyMuPDF)."""
+from PIL import Image
+import threading
+
+# ===========================import PDF rasterizer support=========================
+try:
+    import pymupdf as fitz
+
+    PDF_SUPPORT = True
+except ImportError:
+    try:
+        import fitz
+
+        PDF_SUPPORT = True
+    except ImportError:
+        PDF_SUPPORT = False
+
+# A page's "original" pixel size is its physical size at this DPI (the app's default DPI)
+RASTER_BASE_DPI = 96.0
+MAX_RASTER_DPI = 1200.0
+# PyMuPDF is not thread-safe; prefetch and thumbnail threads all reach it through this module
+_fitz_lock = threading.Lock()
+
+
+def is_pdf(path):
+    return path.lower().endswith('.pdf')
+
+
+def require_pdf_support():
+    if not PDF_SUPPORT:
+        raise RuntimeError("PDF input needs PyMuPDF (pip install pymupdf)")
+
+
+def page_count(path):
+    require_pdf_support()
+    with _fitz_lock, fitz.open(path) as doc:
+        return doc.page_count
+
+
+def page_size(path, index):
+    """Pixel size of a page at RASTER_BASE_DPI."""
+    require_pdf_support()
+    with _fitz_lock, fitz.open(path) as doc:
+        rect = doc.load_page(index).rect
+    return max(1, round(rect.width * RASTER_BASE_DPI / 72)), max(1, round(rect.height * RASTER_BASE_DPI / 72))
+
+
+def render_page(path, index, size):
+    """Rasterizes one page at the lowest DPI whose raster covers size (capped at MAX_RASTER_DPI).
+
+    Only this page is ever rendered, so memory does not grow with the document.
+    """
+    require_pdf_support()
+    with _fitz_lock, fitz.open(path) as doc:
+        page = doc.load_page(index)
+        w_pt, h_pt = page.rect.width, page.rect.height
+        dpi = min(MAX_RASTER_DPI, 72 * max(size[0] / w_pt, size[1] / h_pt))
+        pix = page.get_pixmap(dpi=max(1, int(dpi + 0.999)), alpha=False)
+        return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
@@ -0,0 +1,161 @@
+"""Stages around the batch worker pool: read-ahead threads in front of it, a writer thread behind it.
+
+Workers decode, resize and encode into memory. Input files are read ahead of them on threads, and
+results are written on a thread of their own, so disk and CPU work overlap instead of taking turns.
+Stages are joined by bounded queues: a slow stage holds back the ones before it instead of
+letting work pile up in memory. PipelineClock adds up how busy each stage was, which shows the
+bottleneck.
+"""
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+READ_BLOCK = 1024 * 1024
+_END = object()
+
+
+def read_through(path):
+    """Reads path to the end and drops the bytes. Returns the bytes read.
+
+    Workers are separate processes. Handing them the bytes would copy every file through a pipe;
+    the OS file cache shares them for free, so a worker's later open is served from memory.
+    """
+    buf = bytearray(READ_BLOCK)
+    total = 0
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                return total
+            total += n
+
+
+class PipelineClock:
+    """Busy time per stage and time spent waiting between stages, for a utilization report."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.threads = {}
+        self.busy = {}
+        self.waits = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name, threads):
+        """Declares a stage run by threads threads (or processes)."""
+        self.threads[name] = threads
+        self.busy.setdefault(name, 0.0)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.busy[name] = self.busy.get(name, 0.0) + seconds
+
+    def add_wait(self, name, seconds):
+        with self._lock:
+            self.waits[name] = self.waits.get(name, 0.0) + seconds
+
+    def report(self):
+        """{wall_s, stages: {name: {threads, busy_s, utilization}}, waits_s: {name: seconds}}.
+
+        Utilization is busy time over wall time times threads; the stage closest to 1 is the bottleneck.
+        """
+        wall = perf_counter() - self.started
+        stages = {}
+        for name, threads in self.threads.items():
+            busy = self.busy.get(name, 0.0)
+            stages[name] = {'threads': threads, 'busy_s': round(busy, 4),
+                            'utilization': round(busy / (wall * threads), 4) if wall > 0 else 0.0}
+        return {'wall_s': round(wall, 4), 'stages': stages,
+                'waits_s': {name: round(s, 4) for name, s in self.waits.items()}}
+
+
+def prefetch(items, fn, threads, ahead, clock=None, name="prefetch"):
+    """Yields (item, fn(item)) in item order, running fn on threads up to ahead items before the consumer.
+
+    Unstarted calls are cancelled when the generator is closed; running ones finish in the background.
+    """
+    def timed(item):
+        started = perf_counter()
+        try:
+            return fn(item)
+        finally:
+            clock.add(name, perf_counter() - started)
+
+    if clock is not None:
+        clock.stage(name, threads)
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix=name)
+    window = deque()
+    try:
+        for item in items:
+            window.append((item, pool.submit(timed if clock is not None else fn, item)))
+            if len(window) > ahead:
+                item, future = window.popleft()
+                yield item, future.result()
+        while window:
+            item, future = window.popleft()
+            yield item, future.result()
+    finally:
+        for _, future in window:
+            future.cancel()
+        pool.shutdown(wait=False)
+
+
+class StageThread:
+    """Runs handle(item) on one thread for every put() item, in order, through a queue of at most size items.
+
+    put() blocks while the queue is full. With on_idle, on_idle() runs on the same thread whenever
+    idle_seconds pass without an item. An exception in handle() or on_idle() stops the handling;
+    later items are dropped and the exception is raised again from the next put() or from close().
+    """
+
+    def __init__(self, handle, size, clock=None, name="write", on_idle=None, idle_seconds=1.0):
+        self._handle = handle
+        self._on_idle = on_idle
+        self._idle_seconds = idle_seconds
+        self._queue = queue.Queue(maxsize=max(1, size))
+        self._clock = clock
+        self._name = name
+        self._error = None
+        if clock is not None:
+            clock.stage(name, 1)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._idle_seconds if self._on_idle is not None else None)
+            except queue.Empty:
+                if self._error is None:
+                    try:
+                        self._on_idle()
+                    except BaseException as e:
+                        self._error = e
+                continue
+            if item is _END:
+                return
+            if self._error is not None:
+                continue  # keep draining, so put() never blocks on a dead stage
+            started = perf_counter()
+            try:
+                self._handle(item)
+            except BaseException as e:
+                self._error = e
+            if self._clock is not None:
+                self._clock.add(self._name, perf_counter() - started)
+
+    def put(self, item):
+        if self._error is not None:
+            raise self._error
+        started = perf_counter()
+        self._queue.put(item)
+        if self._clock is not None:
+            self._clock.add_wait(f"{self._name} queue full", perf_counter() - started)
+
+    def close(self):
+        """Waits until every queued item is handled, then raises any exception handle() raised."""
+        self._queue.put(_END)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
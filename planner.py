@@ -0,0 +1,139 @@
+"""Plans the pixel operations that take a decoded source to its output: orient, resize, convert.
+
+EXIF orientation and the app's rotation (multiples of 90 degrees) fold into one lossless transpose.
+plan_operations() then orders transpose, resize and mode conversion by the bytes each one touches,
+so on a downscale the transpose runs on the small output instead of the full-resolution source.
+Conversion always follows the resize: Pillow resamples RGBA with premultiplied alpha and P images
+with nearest neighbour, so converting first would change the output.
+"""
+from PIL import Image
+from itertools import permutations
+from metrics import stage
+
+ORIENTATION_TAG = 0x0112
+Transpose = Image.Transpose
+# EXIF orientation -> transpose that shows the image upright
+EXIF_TRANSPOSE = {
+    2: Transpose.FLIP_LEFT_RIGHT, 3: Transpose.ROTATE_180, 4: Transpose.FLIP_TOP_BOTTOM,
+    5: Transpose.TRANSPOSE, 6: Transpose.ROTATE_270, 7: Transpose.TRANSVERSE, 8: Transpose.ROTATE_90,
+}
+# The app's rotation is clockwise, i.e. rotate(-angle, expand=True)
+ROTATE_TRANSPOSE = {90: Transpose.ROTATE_270, 180: Transpose.ROTATE_180, 270: Transpose.ROTATE_90}
+SWAPS_AXES = (Transpose.ROTATE_90, Transpose.ROTATE_270, Transpose.TRANSPOSE, Transpose.TRANSVERSE)
+# Where (x, y) on a w x h image lands after each transpose
+_MAP_POINT = {
+    Transpose.FLIP_LEFT_RIGHT: lambda x, y, w, h: (w - x, y),
+    Transpose.FLIP_TOP_BOTTOM: lambda x, y, w, h: (x, h - y),
+    Transpose.ROTATE_90: lambda x, y, w, h: (y, w - x),
+    Transpose.ROTATE_180: lambda x, y, w, h: (w - x, h - y),
+    Transpose.ROTATE_270: lambda x, y, w, h: (h - y, x),
+    Transpose.TRANSPOSE: lambda x, y, w, h: (y, x),
+    Transpose.TRANSVERSE: lambda x, y, w, h: (h - y, w - x),
+}
+# Bytes per pixel of the modes Pillow stores in fewer than 4
+_MODE_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2}
+
+
+def _apply(img, transpose):
+    return img if transpose is None else img.transpose(transpose)
+
+
+def _build_compose():
+    """{(first, then): single transpose with the same effect}, found by running both on a probe image."""
+    probe = Image.frombytes("L", (3, 2), bytes(range(6)))
+    elements = [None] + list(Transpose)
+
+    def signature(img):
+        return img.size, img.tobytes()
+
+    by_signature = {signature(_apply(probe, t)): t for t in elements}
+    return {(a, b): by_signature[signature(_apply(_apply(probe, a), b))] for a in elements for b in elements}
+
+
+_COMPOSE = _build_compose()
+
+
+def exif_orientation(img):
+    """EXIF orientation (1-8) of an opened image, 1 when absent. Reads the header only."""
+    # getexif() on a PNG without an early eXIf chunk would decode the whole image to look for one
+    if "exif" not in img.info:
+        return 1
+    try:
+        orientation = img.getexif().get(ORIENTATION_TAG, 1)
+    except Exception:
+        return 1
+    return orientation if orientation in EXIF_TRANSPOSE else 1
+
+
+def orientation_transpose(orientation, angle):
+    """The one transpose that applies EXIF orientation, then rotates angle degrees clockwise. None for neither."""
+    return _COMPOSE[EXIF_TRANSPOSE.get(orientation), ROTATE_TRANSPOSE.get(int(angle) % 360)]
+
+
+def transposed_size(size, transpose):
+    """Size after transpose; also the size before it, since every transpose is its own axis swap."""
+    return (size[1], size[0]) if transpose in SWAPS_AXES else size
+
+
+def transpose_box(box, size, transpose):
+    """Maps a resize box on an image of size through transpose."""
+    if transpose is None:
+        return box
+    x0, y0, x1, y1 = box
+    (ax, ay), (bx, by) = (_MAP_POINT[transpose](x, y, *size) for x, y in ((x0, y0), (x1, y1)))
+    return min(ax, bx), min(ay, by), max(ax, bx), max(ay, by)
+
+
+def mode_bytes(mode):
+    """Bytes per pixel as Pillow stores mode."""
+    return _MODE_BYTES.get(mode, 4)
+
+
+def plan_operations(src_size, mode, target, transpose=None, convert=None, resize=True):
+    """Cheapest order of the operations taking a decoded image to target (w, h), in output orientation.
+
+    Returns [(op, arg), ...] with ("resize", size at that point), ("transpose", method) and
+    ("convert", mode) steps. Each order is costed by the bytes its steps read (and write, for a
+    conversion); resize=False leaves the resize out when the image is already at size.
+    """
+    ops = (["resize"] if resize else []) + (["transpose"] if transpose is not None else []) + \
+          (["convert"] if convert else [])
+    best = None
+    for order in permutations(ops):
+        if "convert" in order and "resize" in order and order.index("convert") < order.index("resize"):
+            continue
+        size, current, oriented, cost, steps = src_size, mode, False, 0, []
+        for op in order:
+            pixels = size[0] * size[1]
+            if op == "resize":
+                cost += pixels * mode_bytes(current)
+                size = target if oriented else transposed_size(target, transpose)
+                steps.append(("resize", size))
+            elif op == "transpose":
+                cost += pixels * mode_bytes(current)
+                size, oriented = transposed_size(size, transpose), True
+                steps.append(("transpose", transpose))
+            else:
+                cost += pixels * (mode_bytes(current) + mode_bytes(convert))
+                current = convert
+                steps.append(("convert", convert))
+        if best is None or cost < best[0]:
+            best = (cost, steps)
+    return best[1]
+
+
+def run_plan(img, steps, resize, box=None):
+    """Runs plan_operations() steps on img. resize(img, size, box) does the resampling; box is the
+    source region to resample (from a reduced-scale decode) and follows any transpose before it."""
+    for op, arg in steps:
+        if op == "resize":
+            img, box = resize(img, arg, box), None
+        elif op == "transpose":
+            if box is not None:
+                box = transpose_box(box, img.size, arg)
+            with stage("rotate"):
+                img = img.transpose(arg)
+        else:
+            with stage("convert"):
+                img = img.convert(arg)
+    return img
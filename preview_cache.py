@@ -0,0 +1,157 @@
+"""Decoded-image cache for the preview pipeline."""
+from PIL import Image
+import os
+import threading
+from collections import OrderedDict
+from engine import RESAMPLE_PROFILES, draft_for_target
+from planner import exif_orientation, orientation_transpose, plan_operations, run_plan, transposed_size
+from pdf_input import PDF_SUPPORT, is_pdf, page_size, render_page
+
+
+# Pyramid levels stop halving below this many pixels on the short side
+PYRAMID_MIN_SIDE = 64
+# File list thumbnails
+THUMB_SIZE = (32, 32)
+
+
+def image_nbytes(img):
+    return img.width * img.height * len(img.getbands())
+
+
+def fit_size(size, box):
+    """Size of an image fitted inside box keeping its aspect ratio, like thumbnail() (never upscales)."""
+    w, h = size
+    scale = min(box[0] / w, box[1] / h, 1.0)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def load_thumbnail(path, resample="best"):
+    """File list thumbnail (PDFs: first page), or None when the file cannot be read."""
+    profile = RESAMPLE_PROFILES[resample]
+    try:
+        if is_pdf(path):
+            if not PDF_SUPPORT:
+                return None
+            img = render_page(path, 0, THUMB_SIZE)
+        else:
+            img = Image.open(path)
+        img.thumbnail(THUMB_SIZE, profile['filter'], reducing_gap=profile['reducing_gap'] or 2.0)
+        return img
+    except Exception:
+        return None
+
+
+def build_pyramid(img, max_size, resample="best", transpose=None):
+    """Fits img into max_size once with the resampling profile, then halves it with reduce(2). Largest first.
+
+    transpose orients img; it is applied after the fit, on the smaller image.
+    """
+    profile = RESAMPLE_PROFILES[resample]
+    base = img if img.mode in ("RGB", "RGBA", "L") else img.convert("RGBA")
+    size = transposed_size(fit_size(base.size, transposed_size(max_size, transpose)), transpose)
+    base = run_plan(base, plan_operations(base.size, base.mode, size, transpose),
+                    lambda im, s, b: im.resize(s, profile['filter'], box=b, reducing_gap=profile['reducing_gap']))
+    levels = [base]
+    while min(levels[-1].size) // 2 >= PYRAMID_MIN_SIDE:
+        levels.append(levels[-1].reduce(2))
+    return levels
+
+
+def pick_level(levels, size):
+    """Smallest level that still covers size, so drawing only ever shrinks."""
+    for level in reversed(levels):
+        if level.width >= size[0] and level.height >= size[1]:
+            return level
+    return levels[0]
+
+
+class ImageCache:
+    """LRU of preview pyramids keyed by (path, mtime, rotate, resample profile), bounded by total bytes.
+
+    Sources are decoded at reduced scale to cover screen_size and rotated before the pyramid is
+    built. Cached images must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes, screen_size):
+        self.max_bytes = max_bytes
+        self.screen_size = screen_size
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _key(self, path, angle, resample):
+        return path, os.stat(path).st_mtime_ns, int(angle) % 360, resample
+
+    def _decode(self, path, angle, resample):
+        if is_pdf(path):
+            # First page only, rasterized to cover the screen
+            orig_size = page_size(path, 0)
+            transpose = orientation_transpose(1, angle)
+            img = render_page(path, 0, fit_size(orig_size, transposed_size(self.screen_size, transpose)))
+            return build_pyramid(img, self.screen_size, resample, transpose), orig_size
+
+        img = Image.open(path)
+        orientation = exif_orientation(img)
+        orig_size = transposed_size(img.size, orientation_transpose(orientation, 0))
+        transpose = orientation_transpose(orientation, angle)
+        draft_for_target(img, transposed_size(self.screen_size, transpose))
+        img.load()
+        return build_pyramid(img, self.screen_size, resample, transpose), orig_size
+
+    def _store(self, key, value):
+        nbytes = sum(image_nbytes(level) for level in value[0])
+        with self._lock:
+            if key in self._items or nbytes > self.max_bytes:
+                return
+            self._items[key] = value
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (old, _) = self._items.popitem(last=False)
+                self._bytes -= sum(image_nbytes(level) for level in old)
+
+    def get(self, path, angle, resample="best"):
+        """Returns (levels, orig_size) where orig_size is the upright size from the file header
+        (EXIF orientation applied, rotate not)."""
+        key = self._key(path, angle, resample)
+        with self._lock:
+            event = self._pending.get(key)
+        if event is not None:
+            event.wait()
+
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+
+        value = self._decode(path, key[2], resample)
+        self._store(key, value)
+        return value
+
+    def prefetch(self, path, angle, resample="best"):
+        """Decodes path on a background thread so a later get() is a hit."""
+        try:
+            key = self._key(path, angle, resample)
+        except OSError:
+            return
+        with self._lock:
+            if key in self._items or key in self._pending:
+                return
+            event = self._pending[key] = threading.Event()
+
+        def work():
+            try:
+                self._store(key, self._decode(path, key[2], resample))
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+                event.set()
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
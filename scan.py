@@ -0,0 +1,69 @@
+"""Folder scanning for the file list: a recursive os.scandir walk and header-only probing.
+
+The walk yields files as it finds them, so the list starts filling before a large tree is fully
+listed. Probing opens each file only far enough to read its header; pixels are never decoded.
+"""
+from PIL import Image
+import os
+from engine import SUPPORTED_FORMATS
+from pdf_input import PDF_SUPPORT, is_pdf, page_size
+
+
+def is_supported(name):
+    return os.path.splitext(name)[1].lower() in SUPPORTED_FORMATS
+
+
+def iter_image_files(paths):
+    """Yields supported files among paths, walking folders recursively, in name order per folder.
+
+    Each file is yielded once even when paths overlap (a folder and a file inside it, or the same
+    folder twice). Symlinked folders are not followed, so link cycles cannot loop the walk.
+    """
+    seen = set()
+
+    def once(path):
+        key = os.path.normcase(os.path.abspath(path))
+        if key in seen:
+            return False
+        seen.add(key)
+        return True
+
+    for path in paths:
+        if not os.path.isdir(path):
+            if is_supported(path) and once(path):
+                yield path
+            continue
+
+        stack = [path]
+        while stack:
+            folder = stack.pop()
+            try:
+                with os.scandir(folder) as it:
+                    entries = sorted(it, key=lambda e: e.name.lower())
+            except OSError:
+                continue  # unreadable folder: skip it, keep walking
+            subfolders = []
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subfolders.append(entry.path)
+                    elif is_supported(entry.name) and entry.is_file() and once(entry.path):
+                        yield entry.path
+                except OSError:
+                    continue
+            # Reversed onto the stack so subfolders are visited in name order
+            stack.extend(reversed(subfolders))
+
+
+def probe_header(path):
+    """(width, height, mode, format) from the file header, or None when it cannot be read. PDFs: first page."""
+    try:
+        if is_pdf(path):
+            if not PDF_SUPPORT:
+                return None
+            w, h = page_size(path, 0)
+            return w, h, "RGB", "PDF"
+        with Image.open(path) as img:
+            return img.width, img.height, img.mode, img.format
+    except Exception:
+        return None
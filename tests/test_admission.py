@@ -0,0 +1,91 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import admit_in_order
+
+
+class Tracker:
+    """Task function that records the total cost running at once."""
+
+    def __init__(self, costs):
+        self.costs = costs
+        self.running = 0
+        self.peak = 0
+        self.alone = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, item, delay):
+        with self._lock:
+            self.running += self.costs[item]
+            self.peak = max(self.peak, self.running)
+        time.sleep(delay)
+        with self._lock:
+            if self.running == self.costs[item]:
+                self.alone.add(item)
+            self.running -= self.costs[item]
+        return item
+
+
+def test_results_come_in_item_order():
+    def later_finishes_first(i):
+        time.sleep(0.05 - i * 0.01)
+        return i
+
+    with ThreadPoolExecutor(4) as pool:
+        got = list(admit_in_order(pool, later_finishes_first, ((i, 1) for i in range(5)), (), None, 4))
+    assert got == list(range(5))
+
+
+def test_running_cost_stays_within_the_budget():
+    costs = {i: 4 for i in range(8)}
+    tracker = Tracker(costs)
+    with ThreadPoolExecutor(4) as pool:
+        got = list(admit_in_order(pool, tracker, costs.items(), (0.02,), 10, 8))
+    assert got == list(range(8))
+    assert tracker.peak <= 8
+
+
+def test_an_item_over_budget_on_its_own_runs_alone():
+    costs = {0: 2, 1: 2, 2: 50, 3: 2}
+    tracker = Tracker(costs)
+    with ThreadPoolExecutor(4) as pool:
+        got = list(admit_in_order(pool, tracker, costs.items(), (0.02,), 10, 4))
+    assert got == [0, 1, 2, 3]
+    assert 2 in tracker.alone
+
+
+def test_items_are_taken_only_ahead_items_at_a_time():
+    taken = []
+
+    def weighted():
+        for i in range(10):
+            taken.append(i)
+            yield i, 1
+
+    with ThreadPoolExecutor(2) as pool:
+        results = admit_in_order(pool, lambda i: i, weighted(), (), None, 3)
+        assert next(results) == 0
+        # The window, plus the one item read ahead to check its cost
+        assert len(taken) <= 3 + 1
+        results.close()
+
+
+def test_closing_cancels_waiting_items():
+    started = []
+    gate = threading.Event()
+
+    def fn(i):
+        started.append(i)
+        if i:
+            gate.wait(5)
+        return i
+
+    pool = ThreadPoolExecutor(1)
+    results = admit_in_order(pool, fn, ((i, 1) for i in range(6)), (), None, 5)
+    assert next(results) == 0
+    results.close()
+    gate.set()
+    pool.shutdown(wait=True)
+    # Item 1 may have started before the close; the rest never do
+    assert started in ([0], [0, 1])
@@ -0,0 +1,86 @@
+import math
+import random
+
+import pytest
+from PIL import Image
+
+import engine
+from engine import HINT_BRACKET, MIN_SEARCH_QUALITY, _search_quality, default_settings, fit_file_size
+
+
+@pytest.fixture(autouse=True)
+def no_hints(monkeypatch):
+    monkeypatch.setattr(engine, "_quality_hints", {})
+
+
+def counting(size_of):
+    """encode(q) whose output is size_of(q) bytes, counting its calls in encode.calls."""
+    def encode(q):
+        encode.calls.append(q)
+        return b"x" * size_of(q)
+    encode.calls = []
+    return encode
+
+
+def noise(size, seed=3):
+    rng = random.Random(seed)
+    img = Image.new("RGB", size)
+    img.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(size[0] * size[1])])
+    return img
+
+
+@pytest.mark.parametrize("limit", [1234, 4567, 8000, 9999])
+def test_search_finds_the_highest_quality_that_fits(limit):
+    encode = counting(lambda q: q * 100)
+    quality, data = _search_quality(encode, limit, MIN_SEARCH_QUALITY, 100, None)
+    assert quality == limit // 100 and len(data) <= limit
+    # The top quality, then a bisection of the rest
+    assert len(encode.calls) <= 2 + math.ceil(math.log2(100 - MIN_SEARCH_QUALITY))
+
+
+def test_search_without_a_fit_returns_the_smallest_encoding():
+    encode = counting(lambda q: 1000 + q)
+    assert _search_quality(encode, 500, MIN_SEARCH_QUALITY, 90, None) == (None, b"x" * (1000 + MIN_SEARCH_QUALITY))
+
+
+@pytest.mark.parametrize("shift", [0, 1, -1, HINT_BRACKET, 1 - HINT_BRACKET])
+def test_a_near_hint_caps_the_encodes(shift):
+    encode = counting(lambda q: q * 100)
+    quality, _ = _search_quality(encode, 5000, MIN_SEARCH_QUALITY, 90, 50 + shift)
+    assert quality == 50
+    # Top quality, hint, neighbour, bracket end, and a bisection of at most HINT_BRACKET values
+    assert len(encode.calls) <= 4 + math.ceil(math.log2(HINT_BRACKET)) + 1
+
+
+def test_jpeg_fits_under_the_limit_by_quality(monkeypatch):
+    img = noise((120, 90))
+    settings = dict(default_settings(), format="JPEG", quality=95)
+    limit = len(engine.encode_image(img, settings, quality=40))
+    out, data = fit_file_size(img, settings, limit)
+    assert out.size == img.size and len(data) <= limit
+    # The hint from the first file lets a second, same-sized one settle in fewer encodes
+    calls = []
+    encode = engine.encode_image
+
+    def counted(*args, **kwargs):
+        calls.append(kwargs.get("quality"))
+        return encode(*args, **kwargs)
+
+    monkeypatch.setattr(engine, "encode_image", counted)
+    out, data = fit_file_size(noise((120, 90), seed=4), settings, limit)
+    assert len(data) <= limit and len(calls) <= 4
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG"])
+def test_too_large_at_any_quality_falls_back_to_downscaling(fmt):
+    img = noise((160, 120))
+    settings = dict(default_settings(), format=fmt, quality=80)
+    limit = len(engine.encode_image(img, settings, quality=MIN_SEARCH_QUALITY if fmt == "JPEG" else 0)) // 2
+    out, data = fit_file_size(img, settings, limit)
+    assert len(data) <= limit
+    assert out.width < img.width and out.height < img.height
+
+
+def test_impossible_limit_raises():
+    with pytest.raises(ValueError):
+        fit_file_size(noise((16, 16)), dict(default_settings(), format="PNG"), 10)
@@ -0,0 +1,96 @@
+import os
+
+from cli import build_parser, settings_from_args
+from engine import OUTPUT_KEYS
+from journal import HASHED_KEYS, JOURNAL_NAME, BatchJournal, settings_hash
+
+SETTINGS = {'width': 800, 'height': 600, 'format': 'JPEG', 'workers': 4}
+
+
+def make_input(tmp_path, name="in.jpg", data=b"image"):
+    path = str(tmp_path / name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def finished_run(tmp_path, task, settings=SETTINGS):
+    journal = BatchJournal(str(tmp_path), settings)
+    journal.claim(task, 0, "out.jpg")
+    journal.complete(task, ["out.jpg"])
+    journal.close()
+
+
+def test_done_task_is_skipped_on_resume(tmp_path):
+    task = (make_input(tmp_path), 0)
+    finished_run(tmp_path, task)
+    assert BatchJournal(str(tmp_path), SETTINGS).is_done(task)
+    assert not BatchJournal(str(tmp_path), SETTINGS).is_done((task[0], 1))
+    assert not BatchJournal(str(tmp_path), SETTINGS, resume=False).is_done(task)
+
+
+def test_changed_input_is_not_done(tmp_path):
+    task = (make_input(tmp_path), 0)
+    finished_run(tmp_path, task)
+    st = os.stat(task[0])
+    os.utime(task[0], ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert not BatchJournal(str(tmp_path), SETTINGS).is_done(task)
+
+    finished_run(tmp_path, task)
+    with open(task[0], "ab") as f:
+        f.write(b"more")
+    os.utime(task[0], ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    assert not BatchJournal(str(tmp_path), SETTINGS).is_done(task)
+
+
+def test_output_settings_are_part_of_the_key(tmp_path):
+    task = (make_input(tmp_path), 0)
+    finished_run(tmp_path, task)
+    assert not BatchJournal(str(tmp_path), dict(SETTINGS, width=640)).is_done(task)
+    # Speed-only settings do not change what a run writes
+    assert BatchJournal(str(tmp_path), dict(SETTINGS, workers=1, metrics=True, frame_ms=40, merge=True,
+                                            memory_mb=512)).is_done(task)
+
+
+def test_hashed_keys_cover_every_output_key():
+    assert set(HASHED_KEYS) == set(OUTPUT_KEYS) | {'rotate', 'outputs'}
+
+
+def test_gui_and_cli_settings_share_a_hash():
+    cli = settings_from_args(build_parser().parse_args(
+        ["in.jpg", "-o", "out", "-u", "px", "-W", "1920", "-q", "75", "--max-kb", "300", "-j", "3"]))
+    # Just the keys main.py's get_current_settings() reads from its widgets
+    gui = {'width': '1920', 'height': '', 'unit': 'px', 'keep_ratio': True, 'format': 'JPEG', 'rotate': '0',
+           'quality': 75, 'rename_option': cli['rename_option'], 'suffix': '', 'dpi': 96.0, 'max_kb': 300.0,
+           'resample': cli['resample'], 'workers': 8, 'merge': False}
+    assert settings_hash(gui) == settings_hash(cli)
+    assert settings_hash(dict(gui, quality=76)) != settings_hash(cli)
+
+
+def test_unfinished_claims_are_reloaded(tmp_path):
+    task = (make_input(tmp_path), 0)
+    journal = BatchJournal(str(tmp_path), SETTINGS)
+    journal.claim(task, 0, "a.jpg")
+    journal.claim(task, 1, "a_1.jpg")
+    journal.close()
+    resumed = BatchJournal(str(tmp_path), SETTINGS)
+    assert not resumed.is_done(task)
+    assert resumed.claimed(task) == {0: "a.jpg", 1: "a_1.jpg"}
+
+
+def test_line_cut_short_is_ignored(tmp_path):
+    task = (make_input(tmp_path), 0)
+    finished_run(tmp_path, task)
+    with open(tmp_path / JOURNAL_NAME, "a", encoding="utf-8") as f:
+        f.write('{"key": ["cut')
+    journal = BatchJournal(str(tmp_path), SETTINGS)
+    assert journal.is_done(task)
+    other = (make_input(tmp_path, "other.jpg"), 0)
+    journal.complete(other, [])
+    journal.close()
+    resumed = BatchJournal(str(tmp_path), SETTINGS)
+    assert resumed.is_done(task) and resumed.is_done(other)
+
+
+def test_missing_input_is_not_done(tmp_path):
+    assert not BatchJournal(str(tmp_path), SETTINGS).is_done((str(tmp_path / "gone.jpg"), 0))
@@ -0,0 +1,107 @@
+import gzip
+import os
+import tarfile
+import time
+
+import pytest
+
+from output_writer import PART_SUFFIX, ArchiveWriter, OutputNames, OutputWriter, free_archive_path
+from pipeline import StageThread
+
+
+def touch(folder, *names):
+    for name in names:
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(b"x")
+
+
+def test_reserve_skips_existing_and_reserved_names(tmp_path):
+    touch(tmp_path, "a.jpg", "a_2.jpg", "b_1.jpg")
+    names = OutputNames(str(tmp_path))
+    got = [os.path.basename(names.reserve("a", ".jpg")) for _ in range(3)]
+    assert got == ["a_1.jpg", "a_3.jpg", "a_4.jpg"]
+    # Same stem, other extension: its own sequence
+    assert os.path.basename(names.reserve("a", ".png")) == "a.png"
+    # A name that looks like a suffixed one is still checked against the index
+    assert os.path.basename(names.reserve("b", ".jpg")) == "b.jpg"
+    assert os.path.basename(names.reserve("b", ".jpg")) == "b_2.jpg"
+
+
+def test_claimed_paths_are_taken(tmp_path):
+    names = OutputNames(str(tmp_path))
+    names.claim(os.path.join(str(tmp_path), "c.jpg"))
+    assert os.path.basename(names.reserve("c", ".jpg")) == "c_1.jpg"
+
+
+def test_without_folder_names_are_bare():
+    names = OutputNames()
+    assert [names.reserve("x", ".png") for _ in range(2)] == ["x.png", "x_1.png"]
+
+
+def test_leftover_part_files_are_swept(tmp_path):
+    touch(tmp_path, "a.jpg" + PART_SUFFIX, "notes" + PART_SUFFIX, "b.jpg")
+    names = OutputNames(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["b.jpg", "notes" + PART_SUFFIX]
+    assert os.path.basename(names.reserve("a", ".jpg")) == "a.jpg"
+
+
+def test_outputs_appear_only_after_flush(tmp_path):
+    writer = OutputWriter(str(tmp_path))
+    path = writer.names.reserve("a", ".jpg")
+    writer.write(path, b"data")
+    assert os.listdir(tmp_path) == ["a.jpg" + PART_SUFFIX]
+    assert writer.flush() == {}
+    assert os.listdir(tmp_path) == ["a.jpg"]
+    with open(path, "rb") as f:
+        assert f.read() == b"data"
+
+
+def test_idle_stage_flushes_without_another_write(tmp_path):
+    writer = OutputWriter(str(tmp_path))
+    flushed = []
+
+    def flush_if_due():
+        if writer.due():
+            flushed.append(writer.flush())
+
+    stage = StageThread(lambda item: writer.write(writer.names.reserve(item, ".jpg"), b"x"), 4,
+                        on_idle=flush_if_due, idle_seconds=0.05)
+    stage.put("a")
+    deadline = time.monotonic() + 5
+    while "a.jpg" not in os.listdir(tmp_path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    stage.close()
+    assert os.listdir(tmp_path) == ["a.jpg"]
+    assert flushed == [{}]
+
+
+def test_tgz_header_names_the_final_archive(tmp_path):
+    path = str(tmp_path / "out.tgz")
+    writer = ArchiveWriter(path)
+    writer.write("a.png", b"x" * 100)
+    writer.close()
+    with open(path, "rb") as f:
+        header = f.read(64)
+    flags, mtime = header[3], int.from_bytes(header[4:8], "little")
+    assert flags & gzip.FNAME and header[10:].split(b"\0")[0] == b"out.tgz"
+    assert abs(mtime - time.time()) < 60
+    with tarfile.open(path) as tar:
+        assert tar.getnames() == ["a.png"]
+
+
+def test_existing_archives_are_never_replaced(tmp_path):
+    touch(tmp_path, "out.zip", "out_1.zip", "out.tar.gz")
+    assert free_archive_path(str(tmp_path / "out.zip")) == str(tmp_path / "out_2.zip")
+    assert free_archive_path(str(tmp_path / "out.tar.gz")) == str(tmp_path / "out_1.tar.gz")
+    assert free_archive_path(str(tmp_path / "new.tgz")) == str(tmp_path / "new.tgz")
+    with pytest.raises(FileExistsError):
+        ArchiveWriter(str(tmp_path / "out.zip"))
+
+
+def test_unpublished_archive_is_deleted(tmp_path):
+    path = str(tmp_path / "out.zip")
+    writer = ArchiveWriter(path)
+    writer.write("a.png", b"x")
+    writer.write("b.png", b"y")
+    assert set(writer.close(publish=False)) == {"a.png", "b.png"}
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,72 @@
+import pytest
+from PIL import Image, ImageOps
+
+from planner import (EXIF_TRANSPOSE, ORIENTATION_TAG, Transpose, orientation_transpose, plan_operations,
+                     run_plan, transpose_box, transposed_size)
+
+ANGLES = (0, 90, 180, 270)
+ORIENTATIONS = range(1, 9)
+
+
+def probe(size=(5, 3)):
+    return Image.frombytes("L", size, bytes(range(size[0] * size[1])))
+
+
+def with_orientation(img, orientation):
+    exif = Image.Exif()
+    exif[ORIENTATION_TAG] = orientation
+    img.info["exif"] = exif.tobytes()
+    return img
+
+
+@pytest.mark.parametrize("orientation", ORIENTATIONS)
+@pytest.mark.parametrize("angle", ANGLES)
+def test_one_transpose_equals_exif_then_rotation(orientation, angle):
+    img = probe()
+    expected = ImageOps.exif_transpose(with_orientation(img.copy(), orientation))
+    if angle:
+        expected = expected.rotate(-angle, expand=True)
+    transpose = orientation_transpose(orientation, angle)
+    got = img if transpose is None else img.transpose(transpose)
+    assert got.size == expected.size and got.tobytes() == expected.tobytes()
+
+
+def test_upright_and_unrotated_needs_no_transpose():
+    assert orientation_transpose(1, 0) is None
+    assert orientation_transpose(None, 360) is None
+
+
+def test_exif_transposes_are_all_distinct():
+    assert len({orientation_transpose(o, 0) for o in ORIENTATIONS}) == len(EXIF_TRANSPOSE) + 1
+
+
+@pytest.mark.parametrize("transpose", list(Transpose))
+def test_transposed_size(transpose):
+    assert transposed_size((5, 3), transpose) == probe().transpose(transpose).size
+
+
+@pytest.mark.parametrize("transpose", list(Transpose))
+def test_transpose_box_follows_the_pixels(transpose):
+    img = probe((7, 4))
+    box = (1, 0, 4, 3)
+    expected = img.crop(box).transpose(transpose)
+    got = img.transpose(transpose).crop(transpose_box(box, img.size, transpose))
+    assert got.tobytes() == expected.tobytes()
+
+
+def test_downscale_transposes_the_small_output():
+    steps = plan_operations((4000, 3000), "RGB", (300, 400), Transpose.ROTATE_90, convert="L")
+    # Converting to L first also makes the transpose cheaper
+    assert steps == [("resize", (400, 300)), ("convert", "L"), ("transpose", Transpose.ROTATE_90)]
+
+
+def test_upscale_transposes_the_small_source():
+    steps = plan_operations((30, 40), "RGB", (4000, 3000), Transpose.ROTATE_90)
+    assert steps == [("transpose", Transpose.ROTATE_90), ("resize", (4000, 3000))]
+
+
+def test_run_plan_reaches_the_target_in_output_orientation():
+    img = Image.new("RGB", (400, 300))
+    steps = plan_operations(img.size, img.mode, (30, 40), Transpose.ROTATE_270, convert="L")
+    out = run_plan(img, steps, lambda im, size, box: im.resize(size, box=box))
+    assert out.size == (30, 40) and out.mode == "L"
@@ -0,0 +1,52 @@
+import os
+
+from PIL import Image
+
+from thumb_cache import ROW_OVERHEAD, ThumbnailCache
+
+
+def make_files(folder, count):
+    paths = []
+    for i in range(count):
+        path = os.path.join(folder, f"f{i}.png")
+        with open(path, "wb") as f:
+            f.write(b"x")
+        paths.append(path)
+    return paths
+
+
+def on_disk(db):
+    """Bytes of the database and its write-ahead log."""
+    return sum(os.path.getsize(p) for p in (db, db + "-wal") if os.path.exists(p))
+
+
+def test_evict_shrinks_file(tmp_path):
+    db = str(tmp_path / "cache.sqlite3")
+    cache = ThumbnailCache(db, max_bytes=10 * 1024 * 1024)
+    paths = make_files(str(tmp_path), 200)
+    # Noise does not compress, so each thumbnail is about 12 KB of PNG
+    thumbs = {p: Image.effect_noise((64, 64), 100).convert("RGB") for p in paths}
+    cache.put_thumbnails(thumbs, "best")
+    full = on_disk(db)
+    assert full > 2 * 1024 * 1024
+
+    cache.max_bytes = 200 * 1024
+    cache.evict()
+    assert on_disk(db) < full / 4
+    kept = cache.get_thumbnails(paths, "best")
+    assert 0 < len(kept) < len(paths)
+    cache.close()
+    assert on_disk(db) <= 200 * 1024 + len(paths) * ROW_OVERHEAD + 64 * 1024
+
+
+def test_closed_cache_is_quiet(tmp_path):
+    cache = ThumbnailCache(str(tmp_path / "cache.sqlite3"))
+    paths = make_files(str(tmp_path), 2)
+    cache.put_headers({paths[0]: (10, 10, "RGB", "PNG")})
+    assert cache.get_headers(paths) == {paths[0]: (10, 10, "RGB", "PNG")}
+    cache.close()
+    cache.put_headers({paths[1]: (10, 10, "RGB", "PNG")})
+    cache.put_thumbnails({paths[1]: Image.new("RGB", (4, 4))}, "best")
+    assert cache.get_headers(paths) == {}
+    assert cache.get_thumbnails(paths, "best") == {}
+    cache.close()
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+from PIL import Image, ImageChops
+
+from tiling import DecodedRows, open_row_source, resize_in_strips
+
+
+def synthetic(size, mode="RGB", seed=7):
+    rng = random.Random(seed)
+    img = Image.new(mode, size)
+    img.putdata([tuple(rng.randrange(256) for _ in mode) if len(mode) > 1 else rng.randrange(256)
+                 for _ in range(size[0] * size[1])])
+    return img
+
+
+def max_difference(a, b):
+    assert a.size == b.size and a.mode == b.mode
+    diff = ImageChops.difference(a, b)
+    return max(band.getextrema()[1] for band in diff.split())
+
+
+@pytest.mark.parametrize("mode", ["RGB", "L"])
+@pytest.mark.parametrize("resample", [Image.Resampling.LANCZOS, Image.Resampling.BILINEAR])
+def test_bmp_strips_match_whole_resize(tmp_path, mode, resample):
+    img = synthetic((97, 301), mode)
+    path = str(tmp_path / "src.bmp")
+    img.save(path)
+    source = open_row_source(path)
+    assert source is not None
+    got = resize_in_strips(source, (40, 123), resample, max_rows=48)
+    assert max_difference(got, img.resize((40, 123), resample)) <= 1
+
+
+def test_box_and_decoded_rows_match_whole_resize():
+    img = synthetic((120, 200))
+    box = (10, 25, 110, 185)
+    got = resize_in_strips(DecodedRows(img), (50, 64), box=box, max_rows=32)
+    assert max_difference(got, img.resize((50, 64), Image.Resampling.LANCZOS, box=box)) <= 1
+
+
+def test_compressed_sources_are_not_raw(tmp_path):
+    path = str(tmp_path / "src.png")
+    synthetic((8, 8)).save(path)
+    assert open_row_source(path) is None
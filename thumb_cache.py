@@ -0,0 +1,200 @@
+"""Persistent file list cache: header info and 32 px thumbnails in one SQLite file.
+
+Rows are keyed by path and are only trusted while the file's mtime and size still match. Thumbnails
+are stored PNG-encoded (a few KB each) together with the resampling profile that made them. Reads
+and writes take whole batches of paths, so reloading a known folder costs one stat per file and a
+query per chunk, with no image decoding. Least recently used rows are evicted past a size limit.
+"""
+from PIL import Image
+import io
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+CACHE_FILE = "thumbnails.sqlite3"
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+# Rows are dropped down to this fraction of the limit, so eviction does not run on every close
+EVICT_TO = 0.8
+# Estimated size of a row without its thumbnail (path, header, index entry)
+ROW_OVERHEAD = 200
+# Paths per SQL statement, below SQLite's bound parameter limit
+QUERY_CHUNK = 500
+PNG_MODES = ("1", "L", "LA", "P", "RGB", "RGBA")
+
+
+def user_cache_dir():
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "SandyResizer")
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _chunks(items, size=QUERY_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def encode_thumbnail(img):
+    buf = io.BytesIO()
+    (img if img.mode in PNG_MODES else img.convert("RGBA")).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class ThumbnailCache:
+    """Header info and thumbnails by path. Safe to share between threads.
+
+    Once closed, lookups find nothing and stores are dropped, so threads still running at
+    shutdown need not be waited for.
+    """
+
+    def __init__(self, path=None, max_bytes=MAX_CACHE_BYTES):
+        self.path = path or os.path.join(user_cache_dir(), CACHE_FILE)
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        # A cache can lose its last writes in a crash; it must not pay for an fsync per batch
+        self._db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER,
+            width INTEGER, height INTEGER, mode TEXT, format TEXT,
+            resample TEXT, thumb BLOB, used INTEGER)""")
+        self._db.commit()
+
+    def _rows(self, paths, columns):
+        """{path: (stat key, row)} for paths whose row matches the file on disk."""
+        keys = {p: k for p, k in ((p, _stat_key(p)) for p in paths) if k is not None}
+        found = {}
+        for chunk in _chunks(list(keys)):
+            marks = ",".join("?" * len(chunk))
+            for row in self._db.execute(f"SELECT path, mtime_ns, size, {columns} FROM files WHERE path IN ({marks})",
+                                        chunk):
+                if (row[1], row[2]) == keys[row[0]]:
+                    found[row[0]] = row[3:]
+        return keys, found
+
+    def _touch(self, paths):
+        now = int(time.time())
+        self._db.executemany("UPDATE files SET used = ? WHERE path = ?", ((now, p) for p in paths))
+        self._db.commit()
+
+    def get_headers(self, paths):
+        """{path: (width, height, mode, format)} for paths with a current cached header."""
+        with self._lock:
+            if self._closed:
+                return {}
+            _, rows = self._rows(paths, "width, height, mode, format")
+            found = {p: tuple(row) for p, row in rows.items() if row[0] is not None}
+            self._touch(found)
+        return found
+
+    def put_headers(self, infos):
+        """Stores {path: (width, height, mode, format)}. A changed file loses its cached thumbnail."""
+        now = int(time.time())
+        rows = []
+        for path, info in infos.items():
+            key = _stat_key(path)
+            if key is not None and info is not None:
+                rows.append((path, *key, *info, now))
+        with self._lock:
+            if self._closed:
+                return
+            self._db.executemany("""
+                INSERT INTO files (path, mtime_ns, size, width, height, mode, format, used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    thumb = CASE WHEN mtime_ns = excluded.mtime_ns AND size = excluded.size THEN thumb END,
+                    mtime_ns = excluded.mtime_ns, size = excluded.size, width = excluded.width,
+                    height = excluded.height, mode = excluded.mode, format = excluded.format,
+                    used = excluded.used""", rows)
+            self._db.commit()
+
+    def get_thumbnails(self, paths, resample):
+        """{path: thumbnail image} for paths with a current thumbnail made with resample."""
+        with self._lock:
+            if self._closed:
+                return {}
+            _, rows = self._rows(paths, "resample, thumb")
+            blobs = {p: row[1] for p, row in rows.items() if row[0] == resample and row[1] is not None}
+            self._touch(blobs)
+        found = {}
+        for path, blob in blobs.items():
+            try:
+                img = Image.open(io.BytesIO(blob))
+                img.load()
+                found[path] = img
+            except Exception:
+                continue  # a damaged row is just a miss
+        return found
+
+    def put_thumbnails(self, thumbs, resample):
+        """Stores {path: thumbnail image} made with resample."""
+        now = int(time.time())
+        rows = []
+        for path, img in thumbs.items():
+            key = _stat_key(path)
+            if key is not None and img is not None:
+                rows.append((path, *key, resample, encode_thumbnail(img), now))
+        with self._lock:
+            if self._closed:
+                return
+            self._db.executemany("""
+                INSERT INTO files (path, mtime_ns, size, resample, thumb, used) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    width = CASE WHEN mtime_ns = excluded.mtime_ns AND size = excluded.size THEN width END,
+                    mtime_ns = excluded.mtime_ns, size = excluded.size,
+                    resample = excluded.resample, thumb = excluded.thumb, used = excluded.used""", rows)
+            self._db.commit()
+
+    def evict(self):
+        """Drops least recently used rows until the cache is under EVICT_TO of max_bytes."""
+        with self._lock:
+            if self._closed:
+                return
+            total = self._db.execute(
+                "SELECT COALESCE(SUM(LENGTH(thumb)), 0) + COUNT(*) * ? FROM files", (ROW_OVERHEAD,)).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            drop = []
+            for path, nbytes in self._db.execute(
+                    "SELECT path, COALESCE(LENGTH(thumb), 0) + ? FROM files ORDER BY used", (ROW_OVERHEAD,)):
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                drop.append((path,))
+                total -= nbytes
+            self._db.executemany("DELETE FROM files WHERE path = ?", drop)
+            self._db.commit()
+            # The pragma frees one page per step; execute() would step it once, executescript() runs it
+            # to the end. In WAL mode the file only shrinks once the freed pages are checkpointed.
+            self._db.executescript("PRAGMA incremental_vacuum; PRAGMA wal_checkpoint(TRUNCATE);")
+
+    def close(self):
+        self.evict()
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._db.close()
+
+
+def open_thumbnail_cache(path=None):
+    """The cache, or None when it cannot be opened (read-only home, damaged file); callers then go without."""
+    try:
+        return ThumbnailCache(path)
+    except (OSError, sqlite3.Error):
+        return None
@@ -0,0 +1,120 @@
+"""Memory-bounded resizing: resample very large sources in horizontal strips.
+
+Each output strip is resampled from just the source rows its filter touches (plus a margin), using
+resize(box=...) so the filter weights match a whole-image resize. Uncompressed BMP sources are
+read from disk strip by strip; other formats are decoded once (JPEGs at reduced DCT scale, see
+engine.draft_for_target) and only the resampling is done in strips.
+"""
+from PIL import Image, ImageFile
+import math
+
+# Source rows held per strip (before the filter margin is added)
+STRIP_SOURCE_ROWS = 512
+# Sources with at least this many pixels go through the strip resampler
+STREAM_MIN_PIXELS = 50_000_000
+# Plugins whose raw tile can be narrowed to a strip by offset alone
+RAW_STRIP_FORMATS = ("BMP", "DIB")
+
+FILTER_SUPPORT = {
+    Image.Resampling.NEAREST: 0.5, Image.Resampling.BOX: 0.5, Image.Resampling.BILINEAR: 1.0,
+    Image.Resampling.HAMMING: 1.0, Image.Resampling.BICUBIC: 2.0, Image.Resampling.LANCZOS: 3.0,
+}
+
+
+class DecodedRows:
+    """Row source over an image that is already in memory."""
+
+    def __init__(self, img):
+        self.img = img
+        self.size = img.size
+        self.mode = img.mode
+
+    def rows(self, y0, y1):
+        return self.img.crop((0, y0, self.size[0], y1))
+
+
+class RawFileRows:
+    """Row source that reads only rows [y0, y1) of an uncompressed image file."""
+
+    def __init__(self, path, size, mode, offset, args):
+        self.path = path
+        self.size = size
+        self.mode = mode
+        self.offset = offset
+        self.args = args
+        _, self.stride, self.ystep = args
+
+    def rows(self, y0, y1):
+        w, h = self.size
+        if self.ystep < 0:
+            # Bottom-up files (BMP) store the last row of the strip first
+            offset = self.offset + (h - y1) * self.stride
+        else:
+            offset = self.offset + y0 * self.stride
+
+        # Reopening keeps the header (and palette); only the tile is narrowed to the strip
+        img = Image.open(self.path)
+        img.tile = [ImageFile._Tile("raw", (0, 0, w, y1 - y0), offset, self.args)]
+        img._size = (w, y1 - y0)
+        img.load()
+        return img
+
+
+def open_row_source(path):
+    """RawFileRows when the file is a single uncompressed tile, otherwise None."""
+    with Image.open(path) as img:
+        if img.format not in RAW_STRIP_FORMATS or len(img.tile) != 1:
+            return None
+        tile = img.tile[0]
+        if tile.codec_name != "raw" or tile.extents != (0, 0) + img.size:
+            return None
+
+        args = tile.args
+        if isinstance(args, str):
+            args = (args, 0, 1)
+        rawmode, stride, ystep = (tuple(args) + (0, 1))[:3]
+        if stride == 0:
+            if rawmode != img.mode:
+                return None
+            stride = len(Image.new(img.mode, (img.size[0], 1)).tobytes())
+
+        return RawFileRows(path, img.size, img.mode, tile.offset, (rawmode, stride, ystep))
+
+
+def should_stream(size):
+    return size[0] * size[1] >= STREAM_MIN_PIXELS
+
+
+def resize_in_strips(source, size, resample=Image.Resampling.LANCZOS, box=None, max_rows=STRIP_SOURCE_ROWS):
+    """Resizes a row source to size, holding at most about max_rows source rows at a time.
+
+    box is the source region to map onto the output (as for Image.resize). Matches a whole-image
+    resize up to rounding.
+    """
+    src_w, src_h = source.size
+    bx0, by0, bx1, by1 = box or (0, 0, src_w, src_h)
+    out_w, out_h = size
+
+    scale = (by1 - by0) / out_h
+    margin = int(math.ceil(FILTER_SUPPORT.get(resample, 3.0) * max(1.0, scale))) + 1
+    rows_per_strip = max(1, int((max_rows - 2 * margin) / scale))
+
+    out = None
+    for oy0 in range(0, out_h, rows_per_strip):
+        oy1 = min(out_h, oy0 + rows_per_strip)
+        y0 = by0 + oy0 * scale
+        y1 = by0 + oy1 * scale
+        sy0 = max(0, int(math.floor(y0)) - margin)
+        sy1 = min(src_h, int(math.ceil(y1)) + margin)
+
+        strip = source.rows(sy0, sy1)
+        part = strip.resize((out_w, oy1 - oy0), resample, box=(bx0, y0 - sy0, bx1, y1 - sy0))
+
+        if out is None:
+            out = Image.new(part.mode, size)
+            if part.mode == "P":
+                out.putpalette(part.palette)
+            out.info.update(part.info)
+        out.paste(part, (0, oy0))
+
+    return out